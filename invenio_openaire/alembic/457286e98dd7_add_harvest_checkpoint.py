@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016-2019 CERN.
+#
+# Invenio is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Add harvest checkpoint."""
+
+from __future__ import absolute_import, print_function
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '457286e98dd7'
+down_revision = 'c49a2c466e6f'
+branch_labels = ()
+depends_on = None
+
+
+def upgrade():
+    """Upgrade database."""
+    op.add_column('openaire_harvest_state',
+                  sa.Column('resumption_token', sa.Text(), nullable=True))
+    op.add_column('openaire_harvest_state',
+                  sa.Column('harvested', sa.Integer(), nullable=False,
+                            server_default='0'))
+    op.add_column('openaire_harvest_state',
+                  sa.Column('started', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    """Downgrade database."""
+    op.drop_column('openaire_harvest_state', 'started')
+    op.drop_column('openaire_harvest_state', 'harvested')
+    op.drop_column('openaire_harvest_state', 'resumption_token')
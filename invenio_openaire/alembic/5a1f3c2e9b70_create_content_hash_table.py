@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016-2019 CERN.
+#
+# Invenio is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Create content hash table."""
+
+from __future__ import absolute_import, print_function
+
+import sqlalchemy as sa
+import sqlalchemy_utils
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '5a1f3c2e9b70'
+down_revision = 'd4f7a7744075'
+branch_labels = ()
+depends_on = '862037093962'
+
+
+def upgrade():
+    """Upgrade database."""
+    op.create_table(
+        'openaire_content_hash',
+        sa.Column('id', sqlalchemy_utils.types.uuid.UUIDType(),
+                  nullable=False),
+        sa.Column('content_hash', sa.String(length=255), nullable=False),
+        sa.ForeignKeyConstraint(['id'], [u'records_metadata.id'],
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+
+def downgrade():
+    """Downgrade database."""
+    op.drop_table('openaire_content_hash')
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016-2019 CERN.
+#
+# Invenio is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Create openaire branch."""
+
+from __future__ import absolute_import, print_function
+
+# revision identifiers, used by Alembic.
+revision = '8b20ac9abc01'
+down_revision = None
+branch_labels = ('invenio_openaire', )
+depends_on = 'dbdbc1b19cf2'
+
+
+def upgrade():
+    """Upgrade database."""
+
+
+def downgrade():
+    """Downgrade database."""
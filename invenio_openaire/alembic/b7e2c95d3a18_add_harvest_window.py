@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016-2019 CERN.
+#
+# Invenio is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Add harvest window."""
+
+from __future__ import absolute_import, print_function
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2c95d3a18'
+down_revision = '5a1f3c2e9b70'
+branch_labels = ()
+depends_on = None
+
+
+def upgrade():
+    """Upgrade database."""
+    op.add_column('openaire_harvest_state',
+                  sa.Column('from_date', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    """Downgrade database."""
+    op.drop_column('openaire_harvest_state', 'from_date')
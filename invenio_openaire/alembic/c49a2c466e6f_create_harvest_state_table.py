@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016-2019 CERN.
+#
+# Invenio is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Create harvest state table."""
+
+from __future__ import absolute_import, print_function
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'c49a2c466e6f'
+down_revision = '8b20ac9abc01'
+branch_labels = ()
+depends_on = None
+
+
+def upgrade():
+    """Upgrade database."""
+    op.create_table(
+        'openaire_harvest_state',
+        sa.Column('setspec', sa.String(length=255), nullable=False),
+        sa.Column('lastrun', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('setspec'),
+    )
+
+
+def downgrade():
+    """Downgrade database."""
+    op.drop_table('openaire_harvest_state')
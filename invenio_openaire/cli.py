@@ -12,13 +12,18 @@ from __future__ import absolute_import, print_function
 
 import json
 import os
+import time
 
 import click
+from flask import current_app
 from flask.cli import with_appcontext
 
 from invenio_openaire.loaders import LocalOAIRELoader, OAIREDumper
-from invenio_openaire.tasks import harvest_all_openaire_projects, \
-    harvest_fundref, harvest_openaire_projects, register_grant
+from invenio_openaire.proxies import current_openaire
+from invenio_openaire.tasks import chunked, harvest_all_openaire_projects, \
+    harvest_fundref, harvest_openaire_projects, load_grants_sharded, \
+    register_grant, register_grants_bulk, send_registration, \
+    wait_for_registrations
 
 
 @click.group()
@@ -32,10 +37,21 @@ def openaire():
     type=click.Path(file_okay=True, dir_okay=False, readable=True,
                     resolve_path=True, exists=True),
     help="FundRef RDF registry data file.")
+@click.option(
+    '--defer-indexing/--no-defer-indexing',
+    default=None,
+    help="Bulk index the records at the end of the harvest "
+         "(default: OPENAIRE_DEFER_INDEXING).")
+@click.option(
+    '--force',
+    default=False,
+    is_flag=True,
+    help="Harvest the remote registry even if it is unchanged.")
 @with_appcontext
-def loadfunders(source=None):
+def loadfunders(source=None, defer_indexing=None, force=False):
     """Harvest funders from FundRef."""
-    harvest_fundref.delay(source=source)
+    harvest_fundref.delay(source=source, defer_indexing=defer_indexing,
+                          force=force)
     click.echo("Background task sent to queue.")
 
 
@@ -55,8 +71,39 @@ def loadfunders(source=None):
     default=False,
     is_flag=True,
     help="Harvest all grants (default: False).")
+@click.option(
+    '--defer-indexing/--no-defer-indexing',
+    default=None,
+    help="Bulk index the records at the end of the harvest "
+         "(default: OPENAIRE_DEFER_INDEXING).")
+@click.option(
+    '--incremental', '-i',
+    default=False,
+    is_flag=True,
+    help="Only harvest grants modified since the last harvest of the set "
+         "(default: False).")
+@click.option(
+    '--processes', '-p',
+    type=int,
+    default=None,
+    help="Number of processes converting the grants of the local database "
+         "(default: OPENAIRE_OAI_LOCAL_PROCESSES).")
+@click.option(
+    '--funder',
+    type=str,
+    default=None,
+    help="Only load the grants of the funder with this DOI from the local "
+         "database.")
+@click.option(
+    '--sharded',
+    default=False,
+    is_flag=True,
+    help="Load the local database in shards of rows by background tasks, "
+         "reading the database from the same path (default: False).")
 @with_appcontext
-def loadgrants(source=None, setspec=None, all_grants=False):
+def loadgrants(source=None, setspec=None, all_grants=False,
+               defer_indexing=None, incremental=False, processes=None,
+               funder=None, sharded=False):
     """Harvest grants from OpenAIRE.
 
     :param source: Load the grants from a local sqlite db (offline).
@@ -70,23 +117,61 @@ def loadgrants(source=None, setspec=None, all_grants=False):
         harvested sequentially in the order specified in the configuration.
         Creates a remote connection to OpenAIRE.
     :type all_grants: bool
+    :param defer_indexing: Queue the records for bulk indexing and index
+        them at the end of the harvest (default: OPENAIRE_DEFER_INDEXING).
+    :type defer_indexing: bool
+    :param incremental: Only harvest the grants modified since the last
+        successful harvest of each set through OAI-PMH.
+    :type incremental: bool
+    :param processes: Number of processes converting the grants of the
+        local sqlite db.
+    :type processes: int
+    :param funder: Only load the grants of the funder with this DOI from
+        the local sqlite db.
+    :type funder: str
+    :param sharded: Load the local sqlite db in shards of
+        OPENAIRE_OAI_LOCAL_SHARD_SIZE rows by background tasks, instead of
+        sending the grants to the queue.
+    :type sharded: bool
     """
     assert all_grants or setspec or source, \
         "Either '--all', '--setspec' or '--source' is required parameter."
+    assert not (incremental and source), \
+        "'--incremental' cannot be used with '--source'."
+    assert source or not (funder or sharded), \
+        "'--funder' and '--sharded' require '--source'."
     if all_grants:
-        harvest_all_openaire_projects.delay()
+        harvest_all_openaire_projects.delay(
+            defer_indexing=defer_indexing, incremental=incremental)
     elif setspec:
         click.echo("Remote grants loading sent to queue.")
-        harvest_openaire_projects.delay(setspec=setspec)
+        harvest_openaire_projects.delay(setspec=setspec,
+                                        defer_indexing=defer_indexing,
+                                        incremental=incremental)
+    elif sharded:
+        load_grants_sharded(source, defer_indexing=defer_indexing,
+                            funder_doi=funder)
+        click.echo("Grants loading shards sent to queue.")
     else:  # if source
+        if defer_indexing is None:
+            defer_indexing = current_app.config['OPENAIRE_DEFER_INDEXING']
+        # Resolve the funders known from the stored funder records too.
+        current_openaire.load_funder_index()
         loader = LocalOAIRELoader(source=source)
         loader._connect()
-        cnt = loader._count()
+        cnt = loader._count(funder_doi=funder)
+        chunk_size = current_app.config['OPENAIRE_GRANTS_CHUNK_SIZE']
         click.echo("Sending grants to queue.")
-        with click.progressbar(loader.iter_grants(), length=cnt) as grants_bar:
-
-            for grant_json in grants_bar:
-                register_grant.delay(grant_json)
+        processes = processes or \
+            current_app.config['OPENAIRE_OAI_LOCAL_PROCESSES']
+        grants = loader.iter_grants(processes=processes, funder_doi=funder)
+        with click.progressbar(grants, length=cnt) as grants_bar:
+            task_ids = [] if defer_indexing else None
+            for chunk in chunked(grants_bar, chunk_size):
+                send_registration(register_grants_bulk, (chunk, ), task_ids,
+                                  defer_indexing=defer_indexing)
+        if task_ids:
+            wait_for_registrations.delay(task_ids, flush_bulk_queue=True)
 
 
 @openaire.command()
@@ -117,13 +202,32 @@ def registergrant(source=None, setspec=None):
     '--setspec', '-s',
     type=str,
     help="Set to harvest and dump (default: projects).")
+@click.option(
+    '--fast',
+    default=False,
+    is_flag=True,
+    help="Batch the inserts, relax the SQLite synchronization and store "
+         "compact JSON (default: False).")
+@click.option(
+    '--compress',
+    default=False,
+    is_flag=True,
+    help="Store the records compressed with zlib (default: False).")
 @with_appcontext
-def dumpgrants(destination, as_json=None, setspec=None):
+def dumpgrants(destination, as_json=None, setspec=None, fast=False,
+               compress=False):
     """Harvest grants from OpenAIRE and store them locally."""
     if os.path.isfile(destination):
         click.confirm("Database '{0}' already exists."
                       "Do you want to write to it?".format(destination),
                       abort=True)  # no cover
+    if as_json:
+        # Resolve the funders known from the stored funder records too.
+        current_openaire.load_funder_index()
     dumper = OAIREDumper(destination,
                          setspec=setspec)
-    dumper.dump(as_json=as_json)
+    started = time.time()
+    count = dumper.dump(as_json=as_json, fast=fast, compress=compress)
+    elapsed = time.time() - started
+    click.echo("Dumped {0} grants ({1:.1f} records/s).".format(
+        count, count / elapsed if elapsed else 0))
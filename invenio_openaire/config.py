@@ -17,6 +17,12 @@ OPENAIRE_FUNDREF_LOCAL_SOURCE = 'data/fundref_registry.rdf.gz'
 OPENAIRE_FUNDREF_ENDPOINT = 'http://dx.doi.org/10.13039/fundref_registry'
 OPENAIRE_CC_SOURCE = 'data/geonames2countrycodes_iso_3166.txt'
 OPENAIRE_OAI_LOCAL_SOURCE = ''  # Large file that requires separate download
+#: Number of processes converting the grants of a local OpenAIRE database
+#: (``None`` to convert them in the loading process).
+OPENAIRE_OAI_LOCAL_PROCESSES = None
+#: Number of rows of the local OpenAIRE database loaded by a single task in
+#: the sharded loading mode.
+OPENAIRE_OAI_LOCAL_SHARD_SIZE = 10000
 OPENAIRE_OAIPMH_ENDPOINT = 'http://api.openaire.eu/oai_pmh'
 OPENAIRE_OAIPMH_DEFAULT_SET = 'projects'
 
@@ -60,6 +66,51 @@ OPENAIRE_GRANTS_SPECS = [
     'WTProjects',
 ]
 
+#: Number of grants registered together by a single bulk task.
+OPENAIRE_GRANTS_CHUNK_SIZE = 500
+
+#: Extraction of the fields of the grant XML, ``'xpath'`` or
+#: ``'single-pass'`` to visit the elements of every record only once.
+OPENAIRE_GRANTS_EXTRACTOR = 'xpath'
+
+#: Queue harvested records for bulk indexing and flush the queue at the end
+#: of a harvest, instead of indexing each record (or chunk) right away.
+OPENAIRE_DEFER_INDEXING = False
+
+#: Number of seconds between the checks of the registration tasks of a
+#: harvest with deferred indexing, before the bulk indexing queue is flushed.
+OPENAIRE_REGISTRATIONS_POLL_INTERVAL = 10
+
+#: Number of OAI-PMH pages fetched ahead while the records of the current
+#: page are converted (``0`` to fetch the pages when needed).
+OPENAIRE_OAIPMH_PREFETCH = 2
+
+#: Number of sets of ``OPENAIRE_GRANTS_SPECS`` harvested concurrently, by
+#: parallel tasks or, with the ``asyncio`` backend, in the event loop of a
+#: single task.
+OPENAIRE_OAIPMH_CONCURRENCY = 1
+
+#: Maximum number of OAI-PMH requests per second, shared by all the workers
+#: harvesting from the same endpoint (``None`` to disable the limit).
+OPENAIRE_OAIPMH_RATE_LIMIT = None
+
+#: Number of OAI-PMH requests which may be sent at once before the rate
+#: limit applies.
+OPENAIRE_OAIPMH_RATE_BURST = 1
+
+#: OAI-PMH client of the remote harvests, ``'sickle'`` or ``'asyncio'`` for
+#: the asyncio client with pooled keep-alive connections (requires Python 3
+#: and the ``asyncio`` extra).
+OPENAIRE_OAIPMH_BACKEND = 'sickle'
+
+#: Maximum number of connections of the asyncio OAI-PMH client.
+OPENAIRE_OAIPMH_ASYNC_CONCURRENCY = 4
+
+#: Directory of the cached FundRef registry downloaded from
+#: ``OPENAIRE_FUNDREF_ENDPOINT`` (``None`` for the ``openaire`` directory of
+#: the application instance path).
+OPENAIRE_FUNDREF_CACHE_DIR = None
+
 OPENAIRE_FIXED_FUNDERS = {
     'aka_________::AKA': 'http://dx.doi.org/10.13039/501100002341',
     'arc_________::ARC': 'http://dx.doi.org/10.13039/501100000923',
@@ -10,11 +10,13 @@
 
 from __future__ import absolute_import, print_function
 
+from flask import current_app
 from invenio_indexer.signals import before_record_index
 
 from . import config
 from .cli import openaire
 from .indexer import indexer_receiver
+from .loaders import FunderIdentifierIndex
 
 
 class InvenioOpenAIRE(object):
@@ -22,6 +24,7 @@ class InvenioOpenAIRE(object):
 
     def __init__(self, app=None):
         """Extension initialization."""
+        self._funder_index = None
         if app:
             self.init_app(app)
 
@@ -32,6 +35,28 @@ class InvenioOpenAIRE(object):
         before_record_index.connect(indexer_receiver, sender=app)
         app.extensions['invenio-openaire'] = self
 
+    @property
+    def funder_index(self):
+        """Index of the funder identifiers shared by all the loaders.
+
+        Built from ``OPENAIRE_FIXED_FUNDERS`` on first use, see
+        :meth:`load_funder_index` to include the stored funders.
+        """
+        if self._funder_index is None:
+            self._funder_index = FunderIdentifierIndex(
+                current_app.config['OPENAIRE_FIXED_FUNDERS'])
+        return self._funder_index
+
+    def load_funder_index(self):
+        """Rebuild the index of the funder identifiers.
+
+        The index is built from ``OPENAIRE_FIXED_FUNDERS`` and the OpenAIRE
+        identifiers of the stored funder records.
+        """
+        self._funder_index = FunderIdentifierIndex.from_records(
+            current_app.config['OPENAIRE_FIXED_FUNDERS'])
+        return self._funder_index
+
     def init_config(self, app):
         """Initialize configuration."""
         for k in dir(config):
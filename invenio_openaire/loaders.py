@@ -22,24 +22,173 @@ loader also capable of fetching it from a remote location.
 
 from __future__ import absolute_import, print_function, unicode_literals
 
+import hashlib
 import json
+import multiprocessing
 import os
 import sqlite3
+import sys
+import tempfile
+import threading
+import time
 import xml.etree.ElementTree as ET
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
 from gzip import GzipFile
+from itertools import islice
 
 import requests
 from flask import current_app
-from invenio_pidstore.errors import PersistentIdentifierError
-from invenio_pidstore.resolver import Resolver
-from invenio_records.api import Record
+from invenio_db import db
+from invenio_pidstore.models import PersistentIdentifier, PIDStatus
+from invenio_records.models import RecordMetadata
 from lxml import etree
 from sickle import Sickle
-from six import string_types, text_type
+from sickle.oaiexceptions import BadResumptionToken, NoRecordsMatch
+from six import PY2, reraise, string_types, text_type
+from six.moves import queue
 from six.moves.urllib.parse import quote_plus
+from six.moves.urllib.request import pathname2url
 
 from . import __path__ as current_package
 from .errors import FunderNotFoundError, OAIRELoadingError
+from .proxies import current_openaire
+
+#: Suffix of the formats of the compressed records of the local dumps.
+COMPRESSED_SUFFIX = '+zlib'
+
+#: Version of the schema of the new local dumps.
+DUMP_SCHEMA_VERSION = 2
+
+#: Filters of the grants of the local dumps, by column of the schema v2.
+DUMP_FILTERS = (
+    ('funder_doi', 'funder_doi = ?'),
+    ('program', 'program = ?'),
+    ('setspec', 'setspec = ?'),
+    ('from_date', 'remote_modified >= ?'),
+    ('until_date', 'remote_modified < ?'),
+)
+
+#: Query of the grants of the local dumps, with the data as UTF-8 bytes, also
+#: when stored as text.
+SELECT_GRANTS = "SELECT CAST(data AS BLOB), format FROM grants"
+
+#: Fields which change without any change of the actual metadata.
+VOLATILE_FIELDS = ('remote_modified', )
+
+#: Fields of the funder records read by the loaders.
+FUNDER_FIELDS = ('acronyms', 'name', 'identifiers')
+
+
+def content_hash(data):
+    """Compute a stable checksum of the metadata of a funder or grant.
+
+    The JSON is serialized canonically and the volatile fields are excluded,
+    so that the checksum only changes when the actual metadata changes. The
+    checksum is stored alongside the records, see
+    :class:`invenio_openaire.models.ContentHash`.
+    """
+    content = {k: v for k, v in data.items() if k not in VOLATILE_FIELDS}
+    serialized = json.dumps(content, sort_keys=True, separators=(',', ':'))
+    return 'md5:{0}'.format(
+        hashlib.md5(serialized.encode('utf-8')).hexdigest())
+
+
+@contextmanager
+def atomic_write(path, mode='wb'):
+    """Write a file through a temporary file, which replaces it once written.
+
+    The temporary file is unique and in the same directory, so that
+    concurrent writers never share it and the file is replaced atomically.
+    """
+    f = tempfile.NamedTemporaryFile(
+        mode=mode, dir=os.path.dirname(path),
+        prefix=os.path.basename(path) + '.', suffix='.part', delete=False)
+    try:
+        with f:
+            yield f
+        # os.rename also replaces the file on POSIX with Python 2.
+        getattr(os, 'replace', os.rename)(f.name, path)
+    except BaseException:
+        os.remove(f.name)
+        raise
+
+
+def xml_parser():
+    """Create a parser of untrusted XML, e.g. the grants or OAI-PMH responses.
+
+    Blank text is removed, and neither the network nor DTDs or external
+    entities are accessed. A parser must not be shared between threads.
+    """
+    return etree.XMLParser(remove_blank_text=True, no_network=True,
+                           load_dtd=False, resolve_entities=False)
+
+
+def iter_funder_records(batch_size=1000):
+    """Iterate over the fields of the registered funder records.
+
+    The PIDs are joined to their records by a single query, streamed in
+    batches, which only fetches the :data:`FUNDER_FIELDS` of the records.
+
+    :returns: Generator of ``(doi, fields)`` tuples, where ``fields`` is a
+        dictionary of the fields of the record (``None`` if missing).
+    """
+    query = db.session.query(
+        PersistentIdentifier.pid_value,
+        *(RecordMetadata.json[field] for field in FUNDER_FIELDS)
+    ).join(
+        RecordMetadata,
+        RecordMetadata.id == PersistentIdentifier.object_uuid,
+    ).filter(
+        PersistentIdentifier.pid_type == 'frdoi',
+        PersistentIdentifier.object_type == 'rec',
+        PersistentIdentifier.status == PIDStatus.REGISTERED,
+        RecordMetadata.json != None,  # noqa
+    )
+    for row in query.yield_per(batch_size):
+        yield row[0], dict(zip(FUNDER_FIELDS, row[1:]))
+
+
+def load_funder_names():
+    """Load the names of all the registered funder records.
+
+    :returns: Dictionary mapping the funder DOIs to their first acronym.
+    """
+    return {doi: fields['acronyms'][0]
+            for doi, fields in iter_funder_records()
+            if fields['acronyms']}
+
+
+def dump_schema_version(connection):
+    """Get the schema version of a local dump.
+
+    The first version of the schema has no metadata table.
+    """
+    row = connection.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND "
+        "name='metadata'").fetchone()
+    if row is None:
+        return 1
+    version, = connection.execute(
+        "SELECT value FROM metadata WHERE key = 'schema_version'").fetchone()
+    return int(version)
+
+
+def connect_readonly(path):
+    """Open a local dump read-only.
+
+    The database is opened as immutable, hence it must not be modified
+    while the connection is open.
+    """
+    if PY2:
+        return sqlite3.connect(path)  # pragma: no cover
+    return sqlite3.connect(
+        'file:{0}?mode=ro&immutable=1'.format(
+            pathname2url(os.path.abspath(path))), uri=True)
 
 
 class JSONSchemaURLFormatter(object):
@@ -76,15 +225,65 @@ class BaseOAIRELoader(object):
     """Base loader for the OpenAIRE dataset."""
 
     def __init__(self, source, funder_resolver=None, namespaces=None,
-                 schema_formatter=None):
-        """Init the loader."""
+                 schema_formatter=None, funder_names=None, extractor=None):
+        """Init the loader.
+
+        :param funder_names: Mapping of funder DOIs to names, used for the
+            funding trees without a short name (default: the names of the
+            funder records, loaded on first use).
+        :param extractor: Extraction of the fields of the grant XML,
+            ``'xpath'`` or ``'single-pass'`` for the :class:`GrantXMLExtractor`
+            (default: ``OPENAIRE_GRANTS_EXTRACTOR``).
+        """
         self.source = source
+        self._parser = None
+        self.extractor = extractor or \
+            current_app.config['OPENAIRE_GRANTS_EXTRACTOR']
+        if self.extractor not in ('xpath', 'single-pass'):
+            raise ValueError(
+                "Unknown grant extractor '{0}'.".format(self.extractor))
         self.funder_resolver = funder_resolver or FundRefDOIResolver()
+        self._funder_names = funder_names
+        # Reload the names loaded from the database on unknown funders.
+        self.refresh_on_miss = funder_names is None
         self.namespaces = namespaces or \
             current_app.config['OPENAIRE_OAIPMH_NAMESPACES']
         self.schema_formatter = schema_formatter or JSONSchemaURLFormatter(
             schema_file=current_app.config['OPENAIRE_SCHEMAS_DEFAULT_GRANT'])
 
+    @property
+    def funder_names(self):
+        """Names of the funders, by DOI."""
+        if self._funder_names is None:
+            self._funder_names = load_funder_names()
+        return self._funder_names
+
+    def refresh_funder_names(self):
+        """Reload the names of the funders on next use.
+
+        Needed when funder records are registered or modified while the
+        loader is in use.
+        """
+        self._funder_names = None
+
+    def __getstate__(self):
+        """Get the state for pickling, without the compiled XPaths."""
+        state = self.__dict__.copy()
+        state['_xpaths'] = {}
+        state['_parser'] = None
+        return state
+
+    @property
+    def parser(self):
+        """Parser of the grant XML, reused for all the records.
+
+        Like the loader, the parser must not be shared between threads, see
+        :func:`xml_parser`.
+        """
+        if self._parser is None:
+            self._parser = xml_parser()
+        return self._parser
+
     def iter_grants(self):
         """Fetch and return the next grant in sequence."""
         return NotImplementedError  # pragma: no cover
@@ -93,27 +292,62 @@ class BaseOAIRELoader(object):
         """Fetch and return all grants."""
         return NotImplementedError  # pragma: no cover
 
+    @property
+    def namespaces(self):
+        """Namespaces used in the XPath expressions."""
+        return self._namespaces
+
+    @namespaces.setter
+    def namespaces(self, value):
+        """Set the namespaces and drop the XPath expressions compiled so far.
+
+        Compiled expressions are bound to the namespace map, hence the cache.
+        """
+        self._namespaces = value
+        self._xpaths = {}
+        self._grant_extractor = None
+
+    @property
+    def grant_extractor(self):
+        """Single-pass extractor of the grant XML fields."""
+        if self._grant_extractor is None:
+            self._grant_extractor = GrantXMLExtractor(self.namespaces)
+        return self._grant_extractor
+
+    def compile_xpath(self, xpath_str):
+        """Return a compiled lxml XPath, cached for the lifetime of loader."""
+        try:
+            return self._xpaths[xpath_str]
+        except KeyError:
+            xpath = etree.XPath(xpath_str, namespaces=self.namespaces)
+            self._xpaths[xpath_str] = xpath
+            return xpath
+
     def get_text_node(self, tree, xpath_str):
         """Return a text node from given XML tree given an lxml XPath."""
         try:
-            text = tree.xpath(xpath_str, namespaces=self.namespaces)[0].text
+            text = self.compile_xpath(xpath_str)(tree)[0].text
             return text_type(text) if text else ''
         except IndexError:  # pragma: nocover
             return ''
 
     def get_subtree(self, tree, xpath_str):
         """Return a subtree given an lxml XPath."""
-        return tree.xpath(xpath_str, namespaces=self.namespaces)
+        return self.compile_xpath(xpath_str)(tree)
 
     def fundertree2json(self, tree, oai_id):
         """Convert OpenAIRE's funder XML to JSON."""
+        return self.resolve_funder(oai_id, **self.extract_funder(tree))
+
+    def extract_funder(self, tree):
+        """Extract the identifiers and names of the funder of a project."""
         try:
             tree = self.get_subtree(tree, 'fundingtree')[0]
         except IndexError:  # pragma: nocover
             pass
 
         funder_node = self.get_subtree(tree, 'funder')
-        subfunder_node = self.get_subtree(tree, '//funding_level_0')
+        subfunder_node = self.get_subtree(tree, './/funding_level_0')
 
         funder_id = self.get_text_node(funder_node[0], './id') \
             if funder_node else None
@@ -123,33 +357,20 @@ class BaseOAIRELoader(object):
             if funder_node else ""
         subfunder_name = self.get_text_node(subfunder_node[0], './name') \
             if subfunder_node else ""
-
-        # Try to resolve the subfunder first, on failure try to resolve the
-        # main funder, on failure raise an error.
-        funder_doi_url = None
-        if subfunder_id:
-            funder_doi_url = self.funder_resolver.resolve_by_id(subfunder_id)
-        if not funder_doi_url:
-            if funder_id:
-                funder_doi_url = self.funder_resolver.resolve_by_id(funder_id)
-        if not funder_doi_url:
-            funder_doi_url = self.funder_resolver.resolve_by_oai_id(oai_id)
+        return dict(funder_id=funder_id, subfunder_id=subfunder_id,
+                    funder_name=funder_name, subfunder_name=subfunder_name)
+
+    def resolve_funder(self, oai_id, funder_id, subfunder_id, funder_name,
+                       subfunder_name):
+        """Resolve the funder of a project to its FundRef DOI."""
+        funder_doi_url = self.resolve_funder_doi_url(oai_id, funder_id,
+                                                     subfunder_id)
         if not funder_doi_url:
             raise FunderNotFoundError(oai_id, funder_id, subfunder_id)
 
         funder_doi = FundRefDOIResolver.strip_doi_host(funder_doi_url)
         if not funder_name:
-            # Grab name from FundRef record.
-            resolver = Resolver(
-                pid_type='frdoi', object_type='rec', getter=Record.get_record)
-            try:
-                dummy_pid, funder_rec = resolver.resolve(funder_doi)
-                funder_name = funder_rec['acronyms'][0]
-            except PersistentIdentifierError:
-                raise OAIRELoadingError(
-                    "Please ensure that funders have been loaded prior to"
-                    "loading grants. Could not resolve funder {0}".format(
-                        funder_doi))
+            funder_name = self.get_funder_name(funder_doi)
 
         return dict(
             doi=funder_doi,
@@ -158,31 +379,91 @@ class BaseOAIRELoader(object):
             program=subfunder_name,
         )
 
+    def resolve_funder_doi_url(self, oai_id, funder_id, subfunder_id):
+        """Resolve the funder of a project to its FundRef DOI URL or None.
+
+        Only the funder identifier index is used, not the funder records.
+        """
+        # Try to resolve the subfunder first, on failure try to resolve the
+        # main funder, on failure resolve the funder from the record id.
+        funder_doi_url = None
+        if subfunder_id:
+            funder_doi_url = self.funder_resolver.resolve_by_id(subfunder_id)
+        if not funder_doi_url:
+            if funder_id:
+                funder_doi_url = self.funder_resolver.resolve_by_id(funder_id)
+        if not funder_doi_url:
+            funder_doi_url = self.funder_resolver.resolve_by_oai_id(oai_id)
+        return funder_doi_url
+
+    def get_funder_name(self, funder_doi):
+        """Get the name of a funder from its FundRef record."""
+        funder_name = self.funder_names.get(funder_doi)
+        if not funder_name and self.refresh_on_miss:
+            # The funder may have been registered since the names were loaded
+            self.refresh_funder_names()
+            funder_name = self.funder_names.get(funder_doi)
+        if not funder_name:
+            raise OAIRELoadingError(
+                "Please ensure that funders have been loaded prior to"
+                "loading grants. Could not resolve funder {0}".format(
+                    funder_doi))
+        return funder_name
+
     def grantxml2json(self, grant_xml):
-        """Convert OpenAIRE grant XML into JSON."""
-        tree = etree.fromstring(grant_xml)
+        """Convert OpenAIRE grant XML into JSON.
+
+        :param grant_xml: XML of the grant record, preferably as UTF-8 bytes,
+            or its parsed lxml element, possibly part of a larger document
+            like an OAI-PMH response.
+        """
+        return self.grantfields2json(**self.grantxml2fields(grant_xml))
+
+    def grantxml2fields(self, grant_xml):
+        """Extract the fields of the OpenAIRE grant XML.
+
+        The funder is not resolved, see :meth:`grantfields2json`.
+
+        :param grant_xml: XML of the grant record, see :meth:`grantxml2json`.
+        """
+        tree = grant_xml if etree.iselement(grant_xml) else \
+            etree.fromstring(grant_xml, self.parser)
+        if self.extractor == 'single-pass':
+            return self.grant_extractor.extract(tree)
+        return self.extract_grant(tree)
+
+    def extract_grant(self, tree):
+        """Extract the fields of the grant XML with XPath expressions."""
         # XML harvested from OAI-PMH has a different format/structure
         if tree.prefix == 'oai':
             ptree = self.get_subtree(
-                tree, '/oai:record/oai:metadata/oaf:entity/oaf:project')[0]
-            header = self.get_subtree(tree, '/oai:record/oai:header')[0]
+                tree, 'oai:metadata/oaf:entity/oaf:project')[0]
+            header = self.get_subtree(tree, 'oai:header')[0]
             oai_id = self.get_text_node(header, 'oai:identifier')
             modified = self.get_text_node(header, 'oai:datestamp')
         else:
             ptree = self.get_subtree(
-                tree, '/record/result/metadata/oaf:entity/oaf:project')[0]
-            header = self.get_subtree(tree, '/record/result/header')[0]
+                tree, 'result/metadata/oaf:entity/oaf:project')[0]
+            header = self.get_subtree(tree, 'result/header')[0]
             oai_id = self.get_text_node(header, 'dri:objIdentifier')
             modified = self.get_text_node(header, 'dri:dateOfTransformation')
 
-        url = self.get_text_node(ptree, 'websiteurl')
-        code = self.get_text_node(ptree, 'code')
-        title = self.get_text_node(ptree, 'title')
-        acronym = self.get_text_node(ptree, 'acronym')
-        startdate = self.get_text_node(ptree, 'startdate')
-        enddate = self.get_text_node(ptree, 'enddate')
+        return dict(
+            oai_id=oai_id,
+            modified=modified,
+            url=self.get_text_node(ptree, 'websiteurl'),
+            code=self.get_text_node(ptree, 'code'),
+            title=self.get_text_node(ptree, 'title'),
+            acronym=self.get_text_node(ptree, 'acronym'),
+            startdate=self.get_text_node(ptree, 'startdate'),
+            enddate=self.get_text_node(ptree, 'enddate'),
+            funder=self.extract_funder(ptree),
+        )
 
-        funder = self.fundertree2json(ptree, oai_id)
+    def grantfields2json(self, oai_id, modified, url, code, title, acronym,
+                         startdate, enddate, funder):
+        """Convert the fields extracted from the grant XML into JSON."""
+        funder = self.resolve_funder(oai_id, **funder)
 
         internal_id = "{0}::{1}".format(funder['doi'], code)
         eurepo_id = \
@@ -212,6 +493,122 @@ class BaseOAIRELoader(object):
         return ret_json
 
 
+class GrantXMLExtractor(object):
+    """Single-pass extractor of the fields of the OpenAIRE grant XML.
+
+    Instead of evaluating an XPath expression per field, the extractor
+    visits the children of the header and of the project once, dispatching
+    on their tags, and stops as soon as all the fields are found. The
+    extracted fields are the same as with
+    :meth:`BaseOAIRELoader.extract_grant`.
+    """
+
+    #: Fields of the grant read from the children of the project, by tag.
+    project_fields = (
+        ('websiteurl', 'url'),
+        ('code', 'code'),
+        ('title', 'title'),
+        ('acronym', 'acronym'),
+        ('startdate', 'startdate'),
+        ('enddate', 'enddate'),
+    )
+
+    def __init__(self, namespaces):
+        """Init the extractor.
+
+        :param namespaces: Namespaces of the ``oai``, ``oaf`` and ``dri``
+            prefixes.
+        """
+        oai = '{{{0}}}'.format(namespaces['oai'])
+        oaf = '{{{0}}}'.format(namespaces['oaf'])
+        dri = '{{{0}}}'.format(namespaces['dri'])
+        project = (oaf + 'entity', oaf + 'project')
+        # Paths of the header, project, identifier and modification date of
+        # the OAI-PMH records and of the records of the OpenAIRE dumps.
+        self.oai_paths = (
+            (oai + 'header',), (oai + 'metadata',) + project,
+            oai + 'identifier', oai + 'datestamp')
+        self.dump_paths = (
+            ('result', 'header'), ('result', 'metadata') + project,
+            dri + 'objIdentifier', dri + 'dateOfTransformation')
+        self.project_tags = tuple(tag for tag, _ in self.project_fields) + \
+            ('fundingtree',)
+
+    def extract(self, tree):
+        """Extract the fields of a grant from its parsed XML.
+
+        :returns: Fields of the grant, see
+            :meth:`BaseOAIRELoader.grantfields2json`.
+        """
+        header_path, project_path, id_tag, modified_tag = \
+            self.oai_paths if tree.prefix == 'oai' else self.dump_paths
+        header = self.find_path(tree, header_path)
+        project = self.find_path(tree, project_path)
+        header_nodes = self.first_children(header, (id_tag, modified_tag))
+        project_nodes = self.first_children(project, self.project_tags)
+
+        fields = {name: self.text(project_nodes.get(tag))
+                  for tag, name in self.project_fields}
+        fields['oai_id'] = self.text(header_nodes.get(id_tag))
+        fields['modified'] = self.text(header_nodes.get(modified_tag))
+        fields['funder'] = self.extract_funder(
+            project_nodes.get('fundingtree', project))
+        return fields
+
+    def extract_funder(self, tree):
+        """Extract the identifiers and names of the funder of a project.
+
+        :returns: Fields of the funder, see
+            :meth:`BaseOAIRELoader.resolve_funder`.
+        """
+        funder = self.first_children(tree, ('funder',)).get('funder')
+        subfunder = next(tree.iterdescendants('funding_level_0'), None)
+        if funder is not None:
+            nodes = self.first_children(funder, ('id', 'shortname'))
+            funder_id = self.text(nodes.get('id'))
+            funder_name = self.text(nodes.get('shortname'))
+        else:
+            funder_id, funder_name = None, ''
+        if subfunder is not None:
+            nodes = self.first_children(subfunder, ('id', 'name'))
+            subfunder_id = self.text(nodes.get('id'))
+            subfunder_name = self.text(nodes.get('name'))
+        else:
+            subfunder_id, subfunder_name = None, ''
+        return dict(funder_id=funder_id, subfunder_id=subfunder_id,
+                    funder_name=funder_name, subfunder_name=subfunder_name)
+
+    @classmethod
+    def find_path(cls, element, tags):
+        """Find the first element at a path of child tags."""
+        if not tags:
+            return element
+        for child in element:
+            if child.tag == tags[0]:
+                found = cls.find_path(child, tags[1:])
+                if found is not None:
+                    return found
+        raise IndexError("No element at path '{0}'.".format('/'.join(tags)))
+
+    @staticmethod
+    def first_children(element, tags):
+        """Get the first child of each tag, visiting the children once."""
+        nodes = {}
+        for child in element:
+            tag = child.tag
+            if tag in tags and tag not in nodes:
+                nodes[tag] = child
+                if len(nodes) == len(tags):
+                    break
+        return nodes
+
+    @staticmethod
+    def text(element):
+        """Get the text of an element, empty if it is missing."""
+        text = element.text if element is not None else None
+        return text_type(text) if text else ''
+
+
 class LocalOAIRELoader(BaseOAIRELoader):
     """Local OpenAIRE dataset loader.
 
@@ -225,6 +622,12 @@ class LocalOAIRELoader(BaseOAIRELoader):
     XML -> XML
     XML -> JSON
     JSON -> JSON
+
+    The records can be stored compressed with zlib, in the ``xml+zlib`` and
+    ``json+zlib`` formats.
+
+    The grants of the databases with the schema version 2 can be filtered
+    by funder, program, set and modification date, see :data:`DUMP_FILTERS`.
     """
 
     def __init__(self, source=None, **kwargs):
@@ -237,6 +640,12 @@ class LocalOAIRELoader(BaseOAIRELoader):
             **kwargs)
         self.db_connection = None
 
+    def __getstate__(self):
+        """Get the state for pickling, without the database connection."""
+        state = super(LocalOAIRELoader, self).__getstate__()
+        state['db_connection'] = None
+        return state
+
     def _is_connected(self):
         return self.db_connection is not None
 
@@ -245,7 +654,7 @@ class LocalOAIRELoader(BaseOAIRELoader):
             if throw:
                 raise Exception("DB already connected.")
         else:
-            self.db_connection = sqlite3.connect(self.source)
+            self.db_connection = connect_readonly(self.source)
 
     def _disconnect(self, throw=False):
         if self._is_connected():
@@ -255,27 +664,174 @@ class LocalOAIRELoader(BaseOAIRELoader):
             if throw:
                 raise Exception("DB not connected.")
 
-    def _count(self):
-        n_grants, = self.db_connection.cursor().execute(
-            "SELECT COUNT(1) from grants").fetchone()
+    def _count(self, **filters):
+        where, params = self._where(**filters)
+        row = None
+        if not where and dump_schema_version(self.db_connection) > 1:
+            # Stored at the end of every dump
+            row = self.db_connection.cursor().execute(
+                "SELECT value FROM metadata WHERE key = 'count'").fetchone()
+        n_grants, = row or self.db_connection.cursor().execute(
+            "SELECT COUNT(1) from grants" + where, params).fetchone()
         return int(n_grants)
 
-    def iter_grants(self, as_json=True):
-        """Fetch records from the SQLite database."""
+    def _where(self, conditions=(), params=(), **filters):
+        """Build the SQL condition of the filters of the grants.
+
+        :param conditions: Conditions to add to the conditions of filters.
+        :param params: Parameters of these conditions.
+        """
+        conditions, params = list(conditions), list(params)
+        filters = {k: v for k, v in filters.items() if v is not None}
+        if filters and dump_schema_version(self.db_connection) < 2:
+            raise OAIRELoadingError(
+                "Filtering the grants requires a dump with the schema "
+                "version 2.")
+        for key, condition in DUMP_FILTERS:
+            value = filters.pop(key, None)
+            if value is not None:
+                conditions.append(condition)
+                if isinstance(value, datetime):
+                    # Compared with the full OAI-PMH datestamps.
+                    value = value.strftime('%Y-%m-%dT%H:%M:%SZ')
+                elif not isinstance(value, string_types):
+                    value = value.strftime('%Y-%m-%d')
+                params.append(value)
+        if filters:
+            raise TypeError("Unknown filters: {0}".format(
+                ', '.join(sorted(filters))))
+        if not conditions:
+            return '', ()
+        return ' WHERE ' + ' AND '.join(conditions), tuple(params)
+
+    def _convert(self, data, data_format, as_json=True):
+        """Convert a grant row to the output format.
+
+        The data is read as UTF-8 bytes, see :data:`SELECT_GRANTS`.
+        """
+        if PY2:
+            data = bytes(data)
+        if data_format.endswith(COMPRESSED_SUFFIX):
+            data = zlib.decompress(data)
+            data_format = data_format[:-len(COMPRESSED_SUFFIX)]
+        if (not as_json) and data_format == 'json':
+            raise Exception("Cannot convert JSON source to XML output.")
+        elif as_json and data_format == 'xml':
+            # The XML is parsed from the bytes, without decoding.
+            data = self.grantxml2json(data)
+        elif as_json and data_format == 'json':
+            data = json.loads(data.decode('utf-8'))
+        else:
+            data = data.decode('utf-8')
+        return data
+
+    def convert_range(self, start, end, as_json=True, **filters):
+        """Convert the grants with a rowid in the range ``[start, end)``."""
+        self.db_connection = connect_readonly(self.source)
+        try:
+            where, params = self._where(
+                ['rowid >= ?', 'rowid < ?'], [start, end], **filters)
+            result = self.db_connection.cursor().execute(
+                SELECT_GRANTS + where + " ORDER BY rowid", params)
+            return [self._convert(data, data_format, as_json=as_json)
+                    for data, data_format in result]
+        finally:
+            self._disconnect()
+
+    def rowid_ranges(self, batch_size):
+        """Split the grants table into ranges of ``batch_size`` rowids.
+
+        :returns: Generator of ``(start, end)`` tuples, see
+            :meth:`convert_range`.
+        """
         self._connect()
+        start, end = self.db_connection.cursor().execute(
+            "SELECT MIN(rowid), MAX(rowid) FROM grants").fetchone()
+        if start is None:
+            return
+        for batch_start in range(start, end + 1, batch_size):
+            yield batch_start, batch_start + batch_size
+
+    def iter_grants(self, as_json=True, processes=None, ordered=True,
+                    batch_size=1000, **filters):
+        """Fetch records from the SQLite database.
+
+        With ``processes``, the grants are converted in a pool of worker
+        processes, each converting a range of ``batch_size`` rows at a time.
+        At most two ranges per worker are converted ahead of the consumer.
+
+        :param processes: Number of worker processes (default: convert the
+            grants in the calling process).
+        :param ordered: Yield the grants in the order of the database, or
+            as soon as their range is converted.
+        :param batch_size: Number of rows converted at a time by a worker.
+        :param filters: Only fetch the grants of a ``funder_doi``,
+            ``program`` or ``setspec``, or modified since ``from_date`` or
+            before ``until_date`` (schema version 2 only). The dates are
+            ``date`` objects, UTC ``datetime`` objects or OAI-PMH datestamp
+            strings.
+        """
+        if processes:
+            for data in self._iter_grants_parallel(
+                    as_json, processes, ordered, batch_size, filters):
+                yield data
+            return
+        self._connect()
+        where, params = self._where(**filters)
         result = self.db_connection.cursor().execute(
-            "SELECT data, format FROM grants"
-        )
+            SELECT_GRANTS + where + " ORDER BY rowid", params)
         for data, data_format in result:
-            if (not as_json) and data_format == 'json':
-                raise Exception("Cannot convert JSON source to XML output.")
-            elif as_json and data_format == 'xml':
-                data = self.grantxml2json(data)
-            elif as_json and data_format == 'json':
-                data = json.loads(data)
-            yield data
+            yield self._convert(data, data_format, as_json=as_json)
         self._disconnect()
 
+    def _iter_grants_parallel(self, as_json, processes, ordered, batch_size,
+                              filters):
+        """Convert the grants in a pool of worker processes."""
+        if as_json:
+            # The names are loaded lazily from the funder records, which the
+            # worker processes have no access to, hence load them before the
+            # loader is sent to the workers.
+            self._funder_names = self.funder_names
+        self._connect()
+        self._where(**dict(filters))
+        ranges = self.rowid_ranges(batch_size)
+        pool = multiprocessing.Pool(processes, initializer=_init_worker,
+                                    initargs=(self, ))
+
+        def convert(args):
+            return pool.apply_async(_convert_range, args + (as_json, filters))
+        try:
+            pending = deque(convert(args)
+                            for args in islice(ranges, 2 * processes))
+            while pending:
+                result = pending[0] if ordered else next(
+                    (r for r in pending if r.ready()), pending[0])
+                pending.remove(result)
+                for args in islice(ranges, 1):
+                    pending.append(convert(args))
+                for data in result.get():
+                    yield data
+        finally:
+            pool.terminate()
+            self._disconnect()
+
+
+#: Loader of the current worker process of a parallel conversion.
+_worker_loader = None
+
+
+def _init_worker(loader):
+    """Set the loader of the worker process."""
+    global _worker_loader
+    _worker_loader = loader
+    _worker_loader.refresh_on_miss = False
+
+
+def _convert_range(start, end, as_json, filters):
+    """Convert a range of grants in the worker process."""
+    return _worker_loader.convert_range(start, end, as_json=as_json,
+                                        **filters)
+
 
 class RemoteOAIRELoader(BaseOAIRELoader):
     """Remote OpenAIRE dataset loader.
@@ -283,37 +839,282 @@ class RemoteOAIRELoader(BaseOAIRELoader):
     Fetch the OpenAIRE records from a remote OAI-PMH endpoint.
     """
 
-    def __init__(self, source=None, setspec=None, **kwargs):
-        """Init the loader for remote OAI-PMH access."""
+    def __init__(self, source=None, setspec=None, from_date=None,
+                 resumption_token=None, harvested=0, throttle=None,
+                 prefetch=None, backend=None, client=None, **kwargs):
+        """Init the loader for remote OAI-PMH access.
+
+        While iterating, ``resumption_token`` is the token which requested
+        the page of the last returned record (``None`` for the first page)
+        and ``harvested`` the number of records on the preceding pages.
+        Both can be stored and passed to a new loader in order to resume an
+        interrupted harvest from the same page.
+
+        :param from_date: Only harvest the records modified since this date
+            (``datetime``, ``date`` or OAI-PMH datestamp string). A resumed
+            harvest restarts from this date if its token has expired.
+        :param resumption_token: Resume the harvest from the page requested
+            with this OAI-PMH resumptionToken.
+        :param harvested: Number of records harvested before the page of the
+            resumption token.
+        :param throttle: Callable invoked before every OAI-PMH request,
+            returning the number of seconds to wait before sending it, e.g.
+            to wait for the request budget of the endpoint.
+        :param prefetch: Number of pages fetched ahead by a background
+            thread while the records are converted, ``0`` to fetch the pages
+            when needed (default: ``OPENAIRE_OAIPMH_PREFETCH``).
+        :param backend: OAI-PMH client, ``'sickle'`` or ``'asyncio'`` for
+            the :class:`invenio_openaire.oaipmh.AsyncOAIPMHClient`
+            (default: ``OPENAIRE_OAIPMH_BACKEND``).
+        :param client: Client of the backend, e.g. an ``AsyncOAIPMHClient``
+            shared by the loaders of concurrently harvested sets (default: a
+            new client of the ``source``).
+        """
         super(RemoteOAIRELoader, self).__init__(
             source or current_app.config['OPENAIRE_OAIPMH_ENDPOINT'],
             **kwargs)
-        self.client = Sickle(self.source)
+        self.backend = backend or current_app.config['OPENAIRE_OAIPMH_BACKEND']
+        if client is not None:
+            self.client = client
+        elif self.backend == 'asyncio':
+            from .oaipmh import AsyncOAIPMHClient
+            self.client = AsyncOAIPMHClient(
+                self.source, throttle=throttle, serialize=False,
+                concurrency=current_app.config[
+                    'OPENAIRE_OAIPMH_ASYNC_CONCURRENCY'])
+        elif self.backend == 'sickle':
+            self.client = Sickle(self.source)
+            if throttle is not None:
+                self.client.harvest = self._throttled(self.client.harvest,
+                                                      throttle)
+        else:
+            raise ValueError(
+                "Unknown OAI-PMH backend '{0}'.".format(self.backend))
         self.setspec = setspec or \
-            current_app.config['OPENAIRE_OAIPMH_DEFAULT_SET'],
+            current_app.config['OPENAIRE_OAIPMH_DEFAULT_SET']
+        self.from_date = from_date
+        self.resumption_token = resumption_token
+        self.harvested = harvested
+        self._page_size = 0
+        self.prefetch = current_app.config['OPENAIRE_OAIPMH_PREFETCH'] \
+            if prefetch is None else prefetch
+
+    @staticmethod
+    def _throttled(harvest, throttle):
+        """Wrap the OAI-PMH request method of the client with a throttle."""
+        def throttled_harvest(**kwargs):
+            wait = throttle()
+            if wait:
+                time.sleep(wait)
+            return harvest(**kwargs)
+        return throttled_harvest
+
+    def list_records_params(self):
+        """Get the arguments of the OAI-PMH ListRecords request."""
+        if self.resumption_token:
+            return dict(resumptionToken=self.resumption_token)
+        params = dict(metadataPrefix='oaf', set=self.setspec)
+        if self.from_date:
+            # Day granularity is supported by every OAI-PMH repository.
+            params['from'] = self.from_date if \
+                isinstance(self.from_date, string_types) else \
+                self.from_date.strftime('%Y-%m-%d')
+        return params
 
     def iter_grants(self, as_json=True):
         """Fetch grants from a remote OAI-PMH endpoint.
 
         Return the Sickle-provided generator object.
         """
-        records = self.client.ListRecords(metadataPrefix='oaf',
-                                          set=self.setspec)
+        try:
+            try:
+                paged_records = self._list_records()
+            except BadResumptionToken:
+                self.restart()
+                paged_records = self._list_records()
+        except NoRecordsMatch:
+            return
+
+        if self.prefetch:
+            paged_records = self._iter_prefetched(paged_records)
+        self._page_size = 0
+        try:
+            for token, rec in paged_records:
+                grant = self.convert_record(token, rec, as_json=as_json)
+                if grant is not None:
+                    yield grant
+        finally:
+            # Stop the requests when the consumer stops.
+            paged_records.close()
+
+    def restart(self):
+        """Restart the harvest from its first page, e.g. once expired."""
+        current_app.logger.warning(
+            "Resumption token of set '{0}' has expired, restarting the "
+            "harvest.".format(self.setspec))
+        self.resumption_token = None
+        self.harvested = 0
+        self._page_size = 0
+
+    def convert_record(self, token, rec, as_json=True):
+        """Convert a harvested record and track the progress of the harvest.
+
+        :param token: Resumption token which requested the page of the
+            record, see :meth:`_iter_paged_records`.
+        :param rec: lxml element of the record.
+        :returns: The grant, or ``None`` if its funder is not found.
+        """
+        if token != self.resumption_token:
+            self.resumption_token = token
+            self.harvested += self._page_size
+            self._page_size = 0
+        self._page_size += 1
+        try:
+            # The records are parsed only once, as part of their page.
+            if as_json:
+                return self.grantxml2json(rec)
+            return etree.tounicode(rec)
+        except FunderNotFoundError as e:
+            current_app.logger.warning(
+                "Funder '{0}' not found.".format(e.funder_id))
+
+    def _list_records(self):
+        """Request the first page of records.
+
+        :returns: Iterator of ``(token, record)`` tuples, see
+            :meth:`_iter_paged_records`.
+        """
+        if self.backend == 'asyncio':
+            return self._list_records_async()
+        return self._iter_paged_records(
+            self.client.ListRecords(**self.list_records_params()))
+
+    def _list_records_async(self):
+        """Request the first page of records with the asyncio client.
+
+        The client runs in its own event loop, closed along with the pool of
+        connections once the records are consumed.
+        """
+        import asyncio
+
+        from .oaipmh import run_async_iterator
+
+        loop = asyncio.new_event_loop()
+        records = self.client.list_records(**self.list_records_params())
+        try:
+            loop.run_until_complete(records.fetch_page())
+        except Exception:
+            loop.run_until_complete(self.client.close())
+            loop.close()
+            raise
+
+        def iter_records():
+            try:
+                for item in run_async_iterator(records, loop=loop):
+                    yield item
+            finally:
+                loop.run_until_complete(self.client.close())
+                loop.close()
+        return iter_records()
+
+    def _iter_paged_records(self, records):
+        """Iterate over the records along with the token of their page.
+
+        :returns: Iterator of ``(token, record)`` tuples, where ``token`` is
+            the resumption token which requested the page of the record and
+            ``record`` its lxml element.
+        """
+        token = self.resumption_token
+        next_token = getattr(records, 'resumption_token', None)
         for rec in records:
+            current_token = getattr(records, 'resumption_token', None)
+            if current_token is not next_token:
+                # Sickle has just requested the next page.
+                token = next_token.token
+                next_token = current_token
+            yield token, rec.xml
+
+    def _iter_prefetched(self, paged_records):
+        """Fetch the pages of records ahead in a background thread.
+
+        At most ``prefetch`` pages are kept in the queue. Errors of the
+        thread are raised once the records fetched before are consumed.
+        The thread stops requesting pages, and closes the paged records,
+        as soon as the consumer stops.
+        """
+        pages = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+
+        def put(item):
+            """Enqueue an item, unless the consumer stops meanwhile.
+
+            :returns: Whether the item was enqueued.
+            """
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def fetch():
+            page = []
+            records = iter(paged_records)
             try:
-                grant_out = rec.raw  # rec.raw is XML
-                if as_json:
-                    grant_out = self.grantxml2json(grant_out)
-                yield grant_out
-            except FunderNotFoundError as e:
-                current_app.logger.warning("Funder '{0}' not found.".format(
-                    e.funder_id))
+                # The next record may require the request of the next page.
+                while not stop.is_set():
+                    try:
+                        token, rec = next(records)
+                    except StopIteration:
+                        if put(page):
+                            put(None)
+                        break
+                    if page and page[0][0] != token:
+                        if not put(page):
+                            break
+                        page = []
+                    page.append((token, rec))
+            except Exception:
+                if put(page):
+                    put(sys.exc_info())
+            finally:
+                # Closed by the thread iterating over the records.
+                paged_records.close()
+
+        app = current_app._get_current_object()
+
+        def fetch_in_app_context():
+            # Requests may be throttled by means of the application.
+            with app.app_context():
+                fetch()
+
+        thread = threading.Thread(target=fetch_in_app_context)
+        thread.daemon = True
+        thread.start()
+        try:
+            while True:
+                page = pages.get()
+                if page is None:
+                    break
+                elif isinstance(page, tuple):
+                    reraise(*page)
+                for item in page:
+                    yield item
+        finally:
+            stop.set()
 
 
 class OAIREDumper(object):
     """Dumper for Open AIRE dataset.
 
     Fetch the OpenAIRE records from a remote OAI-PMH endpoint and dump locally.
+
+    New dumps are created with the schema version 2, where the grants are
+    stored by ``internal_id`` along with indexed columns for filtering, and
+    the ``metadata`` table holds the schema version and the number of
+    grants. Dumps of the first version (``grants(data, format)``) are
+    appended to in the same version.
     """
 
     def __init__(self, destination, setspec='projects'):
@@ -326,6 +1127,88 @@ class OAIREDumper(object):
         self.loader = RemoteOAIRELoader(setspec=setspec)
         self.destination = destination
 
+    def _load_checkpoint(self, connection, version):
+        """Restore the loader state of an interrupted dump of the set.
+
+        The records of the page which was being dumped are removed from dumps
+        of the first version, since the harvest resumes from the beginning of
+        that page. Dumps of the version 2 replace the records by their id.
+        """
+        row = connection.execute(
+            "SELECT resumption_token, harvested, page_rowid FROM "
+            "harvest_state WHERE setspec = ?", (self.loader.setspec, )
+        ).fetchone()
+        if row and row[0]:
+            resumption_token, harvested, page_rowid = row
+            self.loader.resumption_token = resumption_token
+            self.loader.harvested = harvested
+            if version < 2:
+                connection.execute(
+                    "DELETE FROM grants WHERE rowid > ?", (page_rowid, ))
+
+    def _save_checkpoint(self, connection, page_rowid):
+        """Store the loader state along with the dumped records."""
+        connection.execute(
+            "INSERT OR REPLACE INTO harvest_state VALUES (?, ?, ?, ?)",
+            (self.loader.setspec, self.loader.resumption_token,
+             self.loader.harvested, page_rowid))
+
+    @staticmethod
+    def _create_schema(connection):
+        """Create the tables of the current schema version."""
+        connection.execute(
+            "CREATE TABLE grants (internal_id text PRIMARY KEY, oai_id text, "
+            "funder_doi text, program text, setspec text, "
+            "remote_modified text, data blob, format text)")
+        connection.execute("CREATE INDEX grants_oai_id ON grants (oai_id)")
+        connection.execute(
+            "CREATE INDEX grants_funder ON grants (funder_doi, program)")
+        connection.execute("CREATE INDEX grants_setspec ON grants (setspec)")
+        connection.execute(
+            "CREATE INDEX grants_remote_modified ON grants (remote_modified)")
+        connection.execute(
+            "CREATE TABLE metadata (key text PRIMARY KEY, value text)")
+        connection.execute(
+            "INSERT INTO metadata VALUES ('schema_version', ?)",
+            (str(DUMP_SCHEMA_VERSION), ))
+
+    def _grant_row(self, grant_data, as_json, version):
+        """Get the column values of the grant, except the data and format.
+
+        The columns of the XML grants are extracted without converting the
+        grants, hence without the funder records. The funder is resolved by
+        means of the funder identifier index only. If it cannot be resolved,
+        the funder columns are NULL and the OAI identifier of the grant is
+        stored as its key instead of its internal id.
+        """
+        if version < 2:
+            return ()
+        if as_json:
+            return (
+                grant_data['internal_id'],
+                grant_data['identifiers']['oaf'],
+                FundRefDOIResolver.strip_doi_host(
+                    grant_data['funder']['$ref']),
+                grant_data['program'],
+                self.loader.setspec,
+                grant_data['remote_modified'],
+            )
+        fields = self.loader.grantxml2fields(grant_data)
+        funder = fields['funder']
+        funder_doi_url = self.loader.resolve_funder_doi_url(
+            fields['oai_id'], funder['funder_id'], funder['subfunder_id'])
+        funder_doi = FundRefDOIResolver.strip_doi_host(funder_doi_url) \
+            if funder_doi_url else None
+        return (
+            "{0}::{1}".format(funder_doi, fields['code']) if funder_doi
+            else fields['oai_id'],
+            fields['oai_id'],
+            funder_doi,
+            funder['subfunder_name'],
+            self.loader.setspec,
+            fields['modified'],
+        )
+
     @staticmethod
     def _db_exists(connection):
         row = connection.execute("SELECT name FROM sqlite_master WHERE "
@@ -338,32 +1221,173 @@ class OAIREDumper(object):
             raise Exception("Connected database exists, but it's not a valid"
                             "OpenAIRE schema.")
 
-    def dump(self, as_json=True, commit_batch_size=100):
+    def dump(self, as_json=True, commit_batch_size=100, resume=True,
+             fast=False, compress=False):
         """
         Dump the grant information to a local storage.
 
+        The harvesting progress is committed along with the records, so that
+        an interrupted dump of the set can be resumed.
+
+        In fast mode, the records of a batch are inserted together, the JSON
+        is serialized without whitespace and SQLite runs with write-ahead
+        logging and relaxed synchronization during the dump.
+
         :param as_json: Convert XML to JSON before saving (default: True).
+        :param resume: Resume an interrupted dump of the set (default: True).
+        :param fast: Use the fast dump mode (default: False).
+        :param compress: Store the records compressed with zlib, in the
+            ``json+zlib`` or ``xml+zlib`` format (default: False).
+        :returns: Number of dumped records.
         """
+        started = time.time()
         connection = sqlite3.connect(self.destination)
+        try:
+            if fast:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute("PRAGMA synchronous=NORMAL")
+            count = self._dump(connection, as_json, commit_batch_size,
+                               resume, fast, compress)
+            if fast:
+                # Leave a self-contained database file.
+                connection.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            connection.close()
+
+        elapsed = time.time() - started
+        current_app.logger.info(
+            "Dumped {0} grants of set '{1}' in {2:.1f}s ({3:.1f} records/s)."
+            .format(count, self.loader.setspec, elapsed,
+                    count / elapsed if elapsed else 0))
+        return count
+
+    def _dump(self, connection, as_json, commit_batch_size, resume, fast,
+              compress):
+        """Dump the grants through the database connection."""
         format_ = 'json' if as_json else 'xml'
+        if compress:
+            format_ += COMPRESSED_SUFFIX
+        json_kwargs = dict(separators=(',', ':')) if fast else dict(indent=2)
         if not self._db_exists(connection):
-            connection.execute(
-                "CREATE TABLE grants (data text, format text)")
+            self._create_schema(connection)
+        version = dump_schema_version(connection)
+        if version < 2:
+            insert = "INSERT INTO grants VALUES (?, ?)"
+        else:
+            insert = "INSERT OR REPLACE INTO grants VALUES " \
+                "(?, ?, ?, ?, ?, ?, ?, ?)"
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS harvest_state (setspec text PRIMARY "
+            "KEY, resumption_token text, harvested integer, "
+            "page_rowid integer)")
+        if resume:
+            self._load_checkpoint(connection, version)
+        last_rowid, = connection.execute(
+            "SELECT IFNULL(MAX(rowid), 0) FROM grants").fetchone()
+        page_token, page_rowid = self.loader.resumption_token, last_rowid
 
         # This will call the RemoteOAIRELoader.iter_grants and fetch
         # records from remote location.
         grants_iterator = self.loader.iter_grants(as_json=as_json)
+        batch = []
+        idx = 0
         for idx, grant_data in enumerate(grants_iterator, 1):
+            if self.loader.resumption_token != page_token:
+                # Only used by dumps of the first version, where the rowids
+                # are not changed by replaced records.
+                page_token, page_rowid = \
+                    self.loader.resumption_token, last_rowid
+            if not as_json:
+                grant_data = grant_data.encode('utf-8')
+            row = self._grant_row(grant_data, as_json, version)
             if as_json:
-                grant_data = json.dumps(grant_data, indent=2)
-            connection.execute(
-                "INSERT INTO grants VALUES (?, ?)", (grant_data, format_))
+                grant_data = json.dumps(grant_data, **json_kwargs).encode(
+                    'utf-8')
+            if compress:
+                grant_data = zlib.compress(grant_data)
+            # Stored as UTF-8 bytes, read by the loader without decoding.
+            row += (sqlite3.Binary(grant_data), format_)
+            if fast:
+                # Rowids of the batch are assigned in sequence on insert.
+                batch.append(row)
+                last_rowid += 1
+            else:
+                last_rowid = connection.execute(insert, row).lastrowid
 
             # Commit to database every N records
             if idx % commit_batch_size == 0:
+                connection.executemany(insert, batch)
+                batch = []
+                self._save_checkpoint(connection, page_rowid)
                 connection.commit()
+        connection.executemany(insert, batch)
+        connection.execute("DELETE FROM harvest_state WHERE setspec = ?",
+                           (self.loader.setspec, ))
+        if version > 1:
+            connection.execute(
+                "INSERT OR REPLACE INTO metadata "
+                "SELECT 'count', COUNT(1) FROM grants")
         connection.commit()
-        connection.close()
+        return idx
+
+
+class GeoNamesIndex(object):
+    """Compact mapping of the GeoNames IDs to ISO-3166 country codes.
+
+    The IDs are kept in a sorted array of integers, searched by bisection,
+    and the country codes as indices in the table of distinct codes. The
+    indices are shared per process and file, see :meth:`get`.
+    """
+
+    _indices = {}
+    _lock = threading.Lock()
+
+    def __init__(self, ids, codes, code_table):
+        """Init the index from sorted IDs and their country code indices."""
+        self.ids = ids
+        self.codes = codes
+        self.code_table = code_table
+
+    @classmethod
+    def from_file(cls, cc_fname):
+        """Build the index from a file of ``<id>,<country code>`` lines."""
+        code_table = []
+        code_indices = {}
+        entries = []
+        with open(cc_fname, 'r') as F:
+            for line in F:
+                geonames_id, code = line.rstrip('\n').split(',')
+                if code not in code_indices:
+                    code_indices[code] = len(code_table)
+                    code_table.append(code)
+                entries.append((int(geonames_id), code_indices[code]))
+        entries.sort()
+        return cls(array(str('I'), (i for i, _ in entries)),
+                   array(str('B'), (c for _, c in entries)),
+                   tuple(code_table))
+
+    @classmethod
+    def get(cls, cc_fname):
+        """Get the index of a file, built once per process."""
+        with cls._lock:
+            if cc_fname not in cls._indices:
+                cls._indices[cc_fname] = cls.from_file(cc_fname)
+            return cls._indices[cc_fname]
+
+    def __len__(self):
+        """Return the number of IDs."""
+        return len(self.ids)
+
+    def __getitem__(self, geonames_id):
+        """Get the country code of a GeoNames ID (string or integer)."""
+        try:
+            key = int(geonames_id)
+        except ValueError:
+            raise KeyError(geonames_id)
+        pos = bisect_left(self.ids, key)
+        if pos == len(self.ids) or self.ids[pos] != key:
+            raise KeyError(geonames_id)
+        return self.code_table[self.codes[pos]]
 
 
 class GeoNamesResolver(object):
@@ -372,7 +1396,7 @@ class GeoNamesResolver(object):
     def __init__(self, cc_fname=None, cc_data=None):
         """Init the GeoNames country code resolver.
 
-        Provide the cc_data dictionary or create it from file:
+        Provide the cc_data dictionary or load it from file on first use:
 
         # cc_file:
         8502121,US
@@ -380,17 +1404,24 @@ class GeoNamesResolver(object):
         (...)
 
         cc_data = {'8502121':'US', '8740971':'CH', ... }
+
+        The data loaded from file is a :class:`GeoNamesIndex` shared by all
+        resolvers of the process.
         """
+        self._cc_data = cc_data
         if cc_data:
-            self.cc_data = cc_data
             self.cc_fname = None
         else:
             self.cc_fname = cc_fname or os.path.join(
                 current_package[0],
                 current_app.config['OPENAIRE_CC_SOURCE'])
-            with open(self.cc_fname, 'r') as F:
-                self.cc_data = {k: v[:-1] for k, v in (fi.split(',') for fi in
-                                                       F.readlines())}
+
+    @property
+    def cc_data(self):
+        """Return the mapping of the GeoNames IDs to country codes."""
+        if not self._cc_data:
+            self._cc_data = GeoNamesIndex.get(self.cc_fname)
+        return self._cc_data
 
     def cc_from_id(self, geonames_id):
         """Resolve an ISO-3166 2-letter country code from GeoNames ID."""
@@ -410,60 +1441,118 @@ class BaseFundRefLoader(object):
     """
 
     def __init__(self, namespaces=None, cc_resolver=None,
-                 schema_formatter=None):
-        """Init the loader."""
+                 schema_formatter=None, stream=False):
+        """Init the loader.
+
+        :param stream: Incrementally parse the 'skos:Concept' nodes instead
+            of loading the whole registry tree into memory (default: False).
+        """
+        self.stream = stream
         self.namespaces = namespaces or \
             current_app.config['OPENAIRE_FUNDREF_NAMESPACES']
         self.cc_resolver = cc_resolver or GeoNamesResolver()
+        self.funder_resolver = FundRefDOIResolver()
         self.schema_formatter = schema_formatter or JSONSchemaURLFormatter(
             schema_file=current_app.config['OPENAIRE_SCHEMAS_DEFAULT_FUNDER'])
 
+    @property
+    def namespaces(self):
+        """Namespaces of the prefixed tags and attributes."""
+        return self._namespaces
+
+    @namespaces.setter
+    def namespaces(self, value):
+        """Set the namespaces and the qualified tags of the concepts."""
+        self._namespaces = value
+        self._qnames = {}
+        # Children of the 'skos:Concept' nodes read by 'fundrefxml2json'.
+        self.concept_tags = {
+            self.qname(tag): tag for tag in (
+                'skosxl:prefLabel', 'skosxl:altLabel', 'skos:broader',
+                'svf:country', 'svf:fundingBodyType',
+                'svf:fundingBodySubType', 'dct:modified', 'dct:created')
+        }
+
+    def qname(self, prefixed_name):
+        """Get the qualified name of a prefixed tag like 'skos:Concept'."""
+        try:
+            return self._qnames[prefixed_name]
+        except KeyError:
+            prefix, name = prefixed_name.split(':')
+            qname = '{{{0}}}{1}'.format(self.namespaces[prefix], name)
+            self._qnames[prefixed_name] = qname
+            return qname
+
     def get_attrib(self, et_node, prefixed_attrib):
         """Get a prefixed attribute like 'rdf:resource' from ET node."""
-        prefix, attrib = prefixed_attrib.split(':')
-        return et_node.get('{{{0}}}{1}'.format(self.namespaces[prefix],
-                                               attrib))
+        return et_node.get(self.qname(prefixed_attrib))
+
+    def find_first(self, nodes, path):
+        """Find the first node at a path of prefixed tags below the nodes.
+
+        Like ``find`` with the path on each of the nodes in turn.
+        """
+        for node in nodes:
+            if not path:
+                return node
+            found = self.find_first(
+                (child for child in node if child.tag == self.qname(path[0])),
+                path[1:])
+            if found is not None:
+                return found
+        return None
 
     def fundrefxml2json(self, node):
-        """Convert a FundRef 'skos:Concept' node into JSON."""
+        """Convert a FundRef 'skos:Concept' node into JSON.
+
+        The children of the node are visited once, dispatching on their tag.
+        """
+        children = {}
+        for child in node:
+            tag = self.concept_tags.get(child.tag)
+            if tag is not None:
+                children.setdefault(tag, []).append(child)
+
+        def first(tag):
+            return children[tag][0] if tag in children else None
+
         doi = FundRefDOIResolver.strip_doi_host(self.get_attrib(node,
                                                 'rdf:about'))
-        oaf_id = FundRefDOIResolver().resolve_by_doi(
+        oaf_id = self.funder_resolver.resolve_by_doi(
             "http://dx.doi.org/" + doi)
-        name = node.find('./skosxl:prefLabel/skosxl:Label/skosxl:literalForm',
-                         namespaces=self.namespaces).text
+        name = self.find_first(
+            children.get('skosxl:prefLabel', ()),
+            ('skosxl:Label', 'skosxl:literalForm')).text
         # Extract acronyms
         acronyms = []
-        for n in node.findall('./skosxl:altLabel/skosxl:Label',
-                              namespaces=self.namespaces):
-            usagenode = n.find('./fref:usageFlag', namespaces=self.namespaces)
-            if usagenode is not None:
-                if self.get_attrib(usagenode, 'rdf:resource') == \
-                        ('http://data.crossref.org/fundingdata'
-                         '/vocabulary/abbrevName'):
-                    label = n.find('./skosxl:literalForm',
-                                   namespaces=self.namespaces)
-                    if label is not None:
-                        acronyms.append(label.text)
-
-        parent_node = node.find('./skos:broader', namespaces=self.namespaces)
+        label_tag = self.qname('skosxl:Label')
+        for altlabel in children.get('skosxl:altLabel', ()):
+            for n in altlabel:
+                if n.tag != label_tag:
+                    continue
+                usagenode = self.find_first((n,), ('fref:usageFlag',))
+                if usagenode is not None:
+                    if self.get_attrib(usagenode, 'rdf:resource') == \
+                            ('http://data.crossref.org/fundingdata'
+                             '/vocabulary/abbrevName'):
+                        label = self.find_first((n,), ('skosxl:literalForm',))
+                        if label is not None:
+                            acronyms.append(label.text)
+
+        parent_node = first('skos:broader')
         if parent_node is None:
             parent = {}
         else:
             parent = {
                 "$ref": self.get_attrib(parent_node, 'rdf:resource'),
             }
-        country_elem = node.find('./svf:country', namespaces=self.namespaces)
-        country_url = self.get_attrib(country_elem, 'rdf:resource')
+        country_url = self.get_attrib(first('svf:country'), 'rdf:resource')
         country_code = self.cc_resolver.cc_from_url(country_url)
-        type_ = node.find('./svf:fundingBodyType',
-                          namespaces=self.namespaces).text
-        subtype = node.find('./svf:fundingBodySubType',
-                            namespaces=self.namespaces).text
-        country_elem = node.find('./svf:country', namespaces=self.namespaces)
+        type_ = first('svf:fundingBodyType').text
+        subtype = first('svf:fundingBodySubType').text
 
-        modified_elem = node.find('./dct:modified', namespaces=self.namespaces)
-        created_elem = node.find('./dct:created', namespaces=self.namespaces)
+        modified_elem = first('dct:modified')
+        created_elem = first('dct:created')
 
         json_dict = {
             '$schema': self.schema_formatter.schema_url,
@@ -484,10 +1573,52 @@ class BaseFundRefLoader(object):
         }
         return json_dict
 
+    def open_source(self):
+        """Return the file object or path of the FundRef registry.
+
+        File objects other than the source itself are opened for the caller,
+        which closes them.
+        """
+        return self.source
+
+    def close_source(self, source):
+        """Close the file object returned by :meth:`open_source`."""
+        if source is not self.source and hasattr(source, 'close'):
+            source.close()
+
+    def iter_concepts(self):
+        """Incrementally parse the top-level 'skos:Concept' nodes.
+
+        Every top-level node is cleared as soon as it has been processed, so
+        the registry is never held in memory as a whole. The registry is
+        opened anew on every iteration.
+        """
+        concept_tag = self.qname('skos:Concept')
+        root = None
+        depth = 0
+        source = self.open_source()
+        try:
+            for event, elem in ET.iterparse(source, events=('start', 'end')):
+                if event == 'start':
+                    if root is None:
+                        root = elem
+                    depth += 1
+                    continue
+                depth -= 1
+                if depth == 1:
+                    if elem.tag == concept_tag:
+                        yield elem
+                    root.clear()
+        finally:
+            self.close_source(source)
+
     def iter_funders(self):
         """Get a converted list of Funders as JSON dict."""
-        root = self.doc_root
-        funders = root.findall('./skos:Concept', namespaces=self.namespaces)
+        if self.stream:
+            funders = self.iter_concepts()
+        else:
+            funders = self.doc_root.findall('./skos:Concept',
+                                            namespaces=self.namespaces)
         for funder in funders:
             funder_json = self.fundrefxml2json(funder)
             yield funder_json
@@ -496,51 +1627,220 @@ class BaseFundRefLoader(object):
 class LocalFundRefLoader(BaseFundRefLoader):
     """Load the FundRef dataset from a local file."""
 
-    def __init__(self, namespaces=None, cc_resolver=None, source=None):
+    def __init__(self, namespaces=None, cc_resolver=None, source=None,
+                 stream=False):
         """Init the local loader."""
         super(LocalFundRefLoader, self).__init__(
-            namespaces=namespaces, cc_resolver=cc_resolver)
-        source = source or os.path.join(
+            namespaces=namespaces, cc_resolver=cc_resolver, stream=stream)
+        self.source = source or os.path.join(
             current_package[0],
             current_app.config['OPENAIRE_FUNDREF_LOCAL_SOURCE'])
 
-        if isinstance(source, string_types) and source.endswith('.gz'):
-            self.source = GzipFile(source)
-        else:
-            self.source = source
+        if not self.stream:
+            source = self.open_source()
+            try:
+                self.doc_root = ET.parse(source).getroot()
+            finally:
+                self.close_source(source)
+
+    def open_source(self):
+        """Return the path of the FundRef registry, or a new file object.
 
-        self.doc_root = ET.parse(self.source).getroot()
+        Gzipped registries are decompressed on the fly.
+        """
+        if isinstance(self.source, string_types) and \
+                self.source.endswith('.gz'):
+            return GzipFile(self.source)
+        return self.source
 
 
 class RemoteFundRefLoader(BaseFundRefLoader):
-    """Load the FundRef dataset from a remote location."""
+    """Load the FundRef dataset from a remote location.
+
+    The registry is downloaded into an on-disk cache. A cached registry is
+    only downloaded again if the endpoint reports a change of its ETag or
+    Last-Modified date, and its checksum tells whether it changed since the
+    last successful load, see :meth:`is_modified`.
+    """
+
+    headers = {"Content-Type": "application/rdf+xml"}
+
+    def __init__(self, namespaces=None, cc_resolver=None, source=None,
+                 stream=False, cache_dir=None):
+        """Init the remote loader.
 
-    def __init__(self, namespaces=None, cc_resolver=None, source=None):
-        """Init the remote loader."""
+        :param cache_dir: Directory of the cached registry
+            (default: ``OPENAIRE_FUNDREF_CACHE_DIR``).
+        """
         super(RemoteFundRefLoader, self).__init__(
-            namespaces=namespaces, cc_resolver=cc_resolver)
+            namespaces=namespaces, cc_resolver=cc_resolver, stream=stream)
         self.source = source or \
             current_app.config['OPENAIRE_FUNDREF_ENDPOINT']
-        headers = {"Content-Type": "application/rdf+xml"}
+        self.cache_dir = cache_dir or \
+            current_app.config['OPENAIRE_FUNDREF_CACHE_DIR'] or \
+            os.path.join(current_app.instance_path, 'openaire')
+        self.cache_path = os.path.join(self.cache_dir,
+                                       'fundref_registry.rdf')
+        self.checksum = None
+        if not self.stream:
+            self.doc_root = ET.parse(self.download()).getroot()
+
+    def read_cache_info(self):
+        """Get the ETag, Last-Modified date and checksums of the cache."""
+        try:
+            with open(self.cache_path + '.json') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def write_cache_info(self, info):
+        """Store the ETag, Last-Modified date and checksums of the cache."""
+        with atomic_write(self.cache_path + '.json', mode='w') as f:
+            json.dump(info, f)
+
+    def download(self):
+        """Download the registry into the cache, if it has changed.
+
+        The request is conditional on the ETag and Last-Modified date of the
+        cached registry. The registry is downloaded at most once per loader.
+
+        :returns: Path of the cached registry.
+        """
+        if self.checksum is not None:
+            return self.cache_path
+        info = self.read_cache_info()
+        headers = dict(self.headers)
+        if info.get('checksum') and os.path.exists(self.cache_path):
+            if info.get('etag'):
+                headers['If-None-Match'] = info['etag']
+            if info.get('last_modified'):
+                headers['If-Modified-Since'] = info['last_modified']
         obj = requests.get(self.source, stream=True, headers=headers)
-        funders_xml = obj.text.encode('utf-8')
-        self.doc_root = ET.fromstring(funders_xml)
+        if obj.status_code == 304:
+            self.checksum = info['checksum']
+            return self.cache_path
+        obj.raise_for_status()
+        obj.raw.decode_content = True
+
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        checksum = hashlib.sha1()
+        with atomic_write(self.cache_path) as f:
+            for chunk in iter(lambda: obj.raw.read(65536), b''):
+                checksum.update(chunk)
+                f.write(chunk)
+        self.checksum = checksum.hexdigest()
+        info.update(checksum=self.checksum,
+                    etag=obj.headers.get('ETag'),
+                    last_modified=obj.headers.get('Last-Modified'))
+        self.write_cache_info(info)
+        return self.cache_path
+
+    def is_modified(self):
+        """Check if the registry changed since the last successful load."""
+        self.download()
+        return self.checksum != self.read_cache_info().get('loaded_checksum')
+
+    def mark_loaded(self, checksum=None):
+        """Store the checksum of the registry as successfully loaded.
+
+        :param checksum: Checksum of the loaded registry, e.g. once its
+            funders are registered by other tasks (default: the checksum of
+            the cached registry).
+        """
+        if checksum is None:
+            self.download()
+            checksum = self.checksum
+        info = self.read_cache_info()
+        info['loaded_checksum'] = checksum
+        self.write_cache_info(info)
+
+    def open_source(self):
+        """Return the path of the cached registry."""
+        return self.download()
+
+
+class FunderIdentifierIndex(object):
+    """Read-only index of the OpenAIRE ids and FundRef DOIs of the funders.
+
+    Lookups are supported in every direction between the OpenAIRE funder
+    ids, the FundRef DOIs and the DOI URLs. The index of the application is
+    shared by all the loaders, see
+    :attr:`invenio_openaire.ext.InvenioOpenAIRE.funder_index`.
+    """
+
+    def __init__(self, data):
+        """Init the index.
+
+        :param data: Dictionary mapping the OpenAIRE funder ids to the DOI
+            URLs of the funders.
+        """
+        self.doi_urls = dict(data)
+        self.ids = {v: k for k, v in self.doi_urls.items()}
+        self.ids_by_doi = {FundRefDOIResolver.strip_doi_host(v): k
+                           for k, v in self.doi_urls.items()}
+
+    @classmethod
+    def from_records(cls, data):
+        """Create the index from the stored funder records.
+
+        The OpenAIRE ids in ``identifiers.oaf`` of the records are added to
+        the ids of ``data``, which take precedence.
+        """
+        index = {}
+        for doi, fields in iter_funder_records():
+            oaf_id = (fields['identifiers'] or {}).get('oaf')
+            if oaf_id:
+                index[oaf_id] = 'http://dx.doi.org/' + doi
+        index.update(data)
+        return cls(index)
+
+    def get_doi_url(self, funder_id):
+        """Get the DOI URL of an OpenAIRE funder id."""
+        return self.doi_urls.get(funder_id)
+
+    def get_doi(self, funder_id):
+        """Get the DOI of an OpenAIRE funder id."""
+        doi_url = self.doi_urls.get(funder_id)
+        return FundRefDOIResolver.strip_doi_host(doi_url) if doi_url \
+            else None
+
+    def get_id(self, doi):
+        """Get the OpenAIRE funder id of a DOI or DOI URL."""
+        return self.ids.get(doi) or self.ids_by_doi.get(doi)
 
 
 class FundRefDOIResolver(object):
     """Resolve the FundRef funders by constant definitions."""
 
     def __init__(self, data=None):
-        """Init the resolver."""
-        self.data = data or current_app.config['OPENAIRE_FIXED_FUNDERS']
-        self.inverse_data = {v: k for k, v in self.data.items()}
+        """Init the resolver.
+
+        :param data: Dictionary mapping the OpenAIRE funder ids to the DOI
+            URLs of the funders (default: the funder index of the
+            application).
+        """
+        if data:
+            self.index = FunderIdentifierIndex(data)
+        else:
+            self.index = current_openaire.funder_index
+
+    @property
+    def data(self):
+        """DOI URLs of the funders, by OpenAIRE funder id."""
+        return self.index.doi_urls
+
+    @property
+    def inverse_data(self):
+        """Ids of the OpenAIRE funders, by DOI URL."""
+        return self.index.ids
 
     def resolve_by_id(self, funder_id):
         """Resolve the funder from the OpenAIRE funder id.
 
         If funder_id can be resolved, return a URI otherwise return None.
         """
-        return self.data.get(funder_id)
+        return self.index.get_doi_url(funder_id)
 
     def resolve_by_oai_id(self, oai_id):
         """Resolve the funder from the OpenAIRE OAI record id.
@@ -552,11 +1852,11 @@ class FundRefDOIResolver(object):
         prefix = oai_id.split("::")[0]
         suffix = prefix.replace("_", "").upper()
         oaf = "{0}::{1}".format(prefix, suffix)
-        return self.data.get(oaf)
+        return self.index.get_doi_url(oaf)
 
     def resolve_by_doi(self, doi):
-        """Resolve a DOI to an OpenAIRE id."""
-        return self.inverse_data.get(doi)
+        """Resolve a DOI or DOI URL to an OpenAIRE id."""
+        return self.index.get_id(doi)
 
     @staticmethod
     def strip_doi_host(doi_url):
@@ -10,7 +10,14 @@
 
 from __future__ import absolute_import, print_function
 
+from invenio_db import db
+from invenio_pidstore.errors import PIDAlreadyExists
 from invenio_pidstore.models import PersistentIdentifier, PIDStatus
+from sqlalchemy.exc import IntegrityError
+
+#: Number of PIDs inserted by a single statement of the bulk minters, within
+#: the limit of 999 parameters per statement of older SQLite versions.
+BULK_INSERT_SIZE = 100
 
 
 def funder_minter(record_uuid, data):
@@ -23,6 +30,16 @@ def grant_minter(record_uuid, data):
     return minter(record_uuid, data, 'grant', 'internal_id')
 
 
+def funder_bulk_minter(records):
+    """Mint PIDs from many funder records, see :func:`bulk_minter`."""
+    return bulk_minter(records, 'frdoi', 'doi')
+
+
+def grant_bulk_minter(records):
+    """Mint PIDs from many grant records, see :func:`bulk_minter`."""
+    return bulk_minter(records, 'grant', 'internal_id')
+
+
 def minter(record_uuid, data, pid_type, key):
     """Mint PIDs for a record."""
     pid = PersistentIdentifier.create(
@@ -42,3 +59,73 @@ def minter(record_uuid, data, pid_type, key):
                 status=PIDStatus.REGISTERED
             )
     return pid
+
+
+def bulk_minter(records, pid_type, key):
+    """Mint the PIDs of many records at once.
+
+    The PIDs are the same as with :func:`minter`. They are checked for
+    conflicts with a query per PID type, and inserted with multi-row
+    statements.
+
+    :param records: List of ``(record_uuid, data)`` tuples.
+    :raises invenio_pidstore.errors.PIDAlreadyExists: If any of the PIDs is
+        already registered, in which case none is minted.
+    :returns: Number of minted PIDs.
+    """
+    rows = []
+    for record_uuid, data in records:
+        pids = [(pid_type, data[key])] + [
+            (scheme, identifier)
+            for scheme, identifier in data['identifiers'].items()
+            if identifier
+        ]
+        rows.extend(dict(pid_type=scheme, pid_value=value,
+                         status=PIDStatus.REGISTERED, object_type='rec',
+                         object_uuid=record_uuid)
+                    for scheme, value in pids)
+
+    values_by_type = {}
+    for row in rows:
+        values = values_by_type.setdefault(row['pid_type'], set())
+        if row['pid_value'] in values:
+            raise PIDAlreadyExists(row['pid_type'], row['pid_value'])
+        values.add(row['pid_value'])
+    existing = find_existing_pid(values_by_type)
+    if existing:
+        raise PIDAlreadyExists(*existing)
+
+    table = PersistentIdentifier.__table__
+    try:
+        with db.session.begin_nested():
+            for i in range(0, len(rows), BULK_INSERT_SIZE):
+                db.session.execute(
+                    table.insert().values(rows[i:i + BULK_INSERT_SIZE]))
+    except IntegrityError:
+        # PIDs registered concurrently since the check.
+        existing = find_existing_pid(values_by_type)
+        if existing:
+            raise PIDAlreadyExists(*existing)
+        raise
+    return len(rows)
+
+
+def find_existing_pid(values_by_type):
+    """Find an existing PID among many, with a query per PID type.
+
+    :param values_by_type: Dictionary mapping the PID types to sets of PID
+        values.
+    :returns: ``(pid_type, pid_value)`` tuple of the first existing PID
+        found, or ``None``.
+    """
+    for scheme, values in values_by_type.items():
+        values = list(values)
+        for i in range(0, len(values), BULK_INSERT_SIZE):
+            existing = db.session.query(PersistentIdentifier.pid_value).filter(
+                PersistentIdentifier.pid_type == scheme,
+                PersistentIdentifier.pid_value.in_(
+                    values[i:i + BULK_INSERT_SIZE]),
+            ).first()
+            if existing:
+                return scheme, existing.pid_value
+    return None
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016-2019 CERN.
+#
+# Invenio is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Database models for the OpenAIRE harvesting."""
+
+from __future__ import absolute_import, print_function
+
+from datetime import datetime
+
+from invenio_db import db
+from invenio_records.models import RecordMetadata
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy_utils.types import UUIDType
+
+
+class HarvestState(db.Model):
+    """State of the OAI-PMH harvesting of an OpenAIRE set."""
+
+    __tablename__ = 'openaire_harvest_state'
+
+    setspec = db.Column(db.String(255), primary_key=True)
+    """OAI-PMH set specification."""
+
+    lastrun = db.Column(db.DateTime, nullable=True)
+    """Start time of the last successful harvest of the set."""
+
+    resumption_token = db.Column(db.Text, nullable=True)
+    """Token of the page from which an interrupted harvest resumes."""
+
+    harvested = db.Column(db.Integer, nullable=False, default=0)
+    """Number of records harvested before the page of the token."""
+
+    started = db.Column(db.DateTime, nullable=True)
+    """Start time of the interrupted harvest."""
+
+    from_date = db.Column(db.DateTime, nullable=True)
+    """Start of the modification window of the interrupted harvest."""
+
+    @classmethod
+    def get(cls, setspec):
+        """Get the harvesting state of a set or None."""
+        return cls.query.get(setspec)
+
+    @classmethod
+    def get_lastrun(cls, setspec):
+        """Get the start time of the last successful harvest of a set."""
+        state = cls.get(setspec)
+        return state.lastrun if state else None
+
+    @classmethod
+    def get_or_create(cls, setspec):
+        """Get the harvesting state of a set, create it if needed."""
+        state = cls.get(setspec)
+        if state is None:
+            state = cls(setspec=setspec, harvested=0)
+            db.session.add(state)
+        return state
+
+    @classmethod
+    def update_lastrun(cls, setspec, lastrun):
+        """Set the start time of the last successful harvest of a set.
+
+        The checkpoint of the harvest is cleared.
+        """
+        with db.session.begin_nested():
+            state = cls.get_or_create(setspec)
+            state.lastrun = lastrun
+            state.resumption_token = None
+            state.harvested = 0
+            state.started = None
+            state.from_date = None
+        return state
+
+    @classmethod
+    def checkpoint(cls, setspec, resumption_token, harvested, started,
+                   from_date=None):
+        """Store the progress of a running harvest of a set.
+
+        :param from_date: Start of the modification window of an incremental
+            harvest, from which it restarts if the resumption token expires.
+        """
+        with db.session.begin_nested():
+            state = cls.get_or_create(setspec)
+            state.resumption_token = resumption_token
+            state.harvested = harvested
+            state.started = started
+            state.from_date = from_date
+        return state
+
+
+class RequestBudget(db.Model):
+    """Token bucket of the requests to an OAI-PMH endpoint.
+
+    The bucket is stored in the database, so that it is shared by all the
+    workers harvesting from the same endpoint.
+    """
+
+    __tablename__ = 'openaire_request_budget'
+
+    endpoint = db.Column(db.String(255), primary_key=True)
+    """URL of the OAI-PMH endpoint."""
+
+    tokens = db.Column(db.Float, nullable=False)
+    """Available requests, negative when requests have been reserved."""
+
+    updated = db.Column(db.DateTime, nullable=False)
+    """Time of the last refill of the bucket."""
+
+    @classmethod
+    def consume(cls, endpoint, rate, burst=1, now=None):
+        """Reserve a request to an endpoint.
+
+        The bucket is refilled with ``rate`` tokens per second, up to
+        ``burst`` tokens. The bucket is updated in its own transaction.
+
+        :returns: Number of seconds to wait before sending the request.
+        """
+        now = now or datetime.utcnow()
+        table = cls.__table__
+        with db.engine.begin() as conn:
+            row = conn.execute(
+                table.select().where(table.c.endpoint == endpoint)
+                .with_for_update()).first()
+            if row is None:
+                try:
+                    with conn.begin_nested():
+                        conn.execute(table.insert().values(
+                            endpoint=endpoint, tokens=burst - 1.0,
+                            updated=now))
+                    return 0.0
+                except IntegrityError:
+                    # Created concurrently by another worker.
+                    row = conn.execute(
+                        table.select().where(table.c.endpoint == endpoint)
+                        .with_for_update()).first()
+            elapsed = max((now - row.updated).total_seconds(), 0)
+            tokens = min(float(burst), row.tokens + elapsed * rate) - 1
+            conn.execute(table.update().where(
+                table.c.endpoint == endpoint).values(
+                    tokens=tokens, updated=now))
+        return max(-tokens / rate, 0.0)
+
+
+class ContentHash(db.Model):
+    """Content hash of the metadata of a harvested funder or grant record.
+
+    The hash is stored alongside the record, outside of its metadata, in
+    order to detect the changes of the harvested metadata, see
+    :func:`invenio_openaire.loaders.content_hash`.
+    """
+
+    __tablename__ = 'openaire_content_hash'
+
+    id = db.Column(
+        UUIDType,
+        db.ForeignKey(RecordMetadata.id, ondelete='CASCADE'),
+        primary_key=True,
+    )
+    """Record identifier."""
+
+    content_hash = db.Column(db.String(255), nullable=False)
+    """Content hash of the metadata of the record."""
+
+    @classmethod
+    def get_many(cls, record_ids):
+        """Get the content hashes of many records in one query.
+
+        :returns: Dictionary mapping the record identifiers to their content
+            hash. Records without a content hash are left out.
+        """
+        record_ids = list(record_ids)
+        if not record_ids:
+            return {}
+        return {
+            row.id: row.content_hash
+            for row in cls.query.filter(cls.id.in_(record_ids))
+        }
+
+    @classmethod
+    def set(cls, record_id, content_hash, created=False):
+        """Store the content hash of a record.
+
+        :param created: The record has just been created, hence has no
+            content hash yet.
+        """
+        row = cls(id=record_id, content_hash=content_hash)
+        if created:
+            db.session.add(row)
+            return row
+        return db.session.merge(row)
+
+
+__all__ = ('ContentHash', 'HarvestState', 'RequestBudget')
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016-2019 CERN.
+#
+# Invenio is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Asynchronous OAI-PMH client.
+
+The client harvests through a pool of keep-alive HTTP connections with gzip
+transfer encoding, shared by all the concurrent requests, e.g. the harvests
+of independent sets running in a single event loop. It requires Python 3 and
+``aiohttp``, available with the ``asyncio`` extra of Invenio-OpenAIRE.
+
+The OAI-PMH errors are raised as :mod:`sickle.oaiexceptions`, like with the
+default Sickle client.
+"""
+
+import asyncio
+
+import aiohttp
+from lxml import etree
+from sickle import oaiexceptions
+
+from .loaders import xml_parser
+
+OAI_NAMESPACE = '{http://www.openarchives.org/OAI/2.0/}'
+
+
+class AsyncOAIPMHClient(object):
+    """Asynchronous OAI-PMH client.
+
+    Use the client as an asynchronous context manager, which opens and
+    closes the pool of connections, e.g.:
+
+    .. code-block:: python
+
+        async with AsyncOAIPMHClient(endpoint) as client:
+            async for token, record in client.list_records(
+                    metadataPrefix='oaf', set='ECProjects'):
+                ...
+    """
+
+    def __init__(self, endpoint, concurrency=4, timeout=60, throttle=None,
+                 serialize=True):
+        """Init the client.
+
+        :param endpoint: URL of the OAI-PMH endpoint.
+        :param concurrency: Maximum number of concurrent connections.
+        :param timeout: Timeout of a request, in seconds.
+        :param throttle: Callable invoked before every request, returning
+            the number of seconds to wait before sending it. It runs in the
+            default executor of the event loop, so that it does not block
+            the concurrent requests.
+        :param serialize: Return the items as serialized XML, or else as the
+            lxml elements of the parsed responses.
+        """
+        self.endpoint = endpoint
+        self.serialize = serialize
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.throttle = throttle
+        self.parser = xml_parser()
+        self.session = None
+
+    async def __aenter__(self):
+        """Open the pool of connections."""
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        """Close the pool of connections."""
+        await self.close()
+
+    async def open(self):
+        """Open the pool of connections."""
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency),
+                headers={'Accept-Encoding': 'gzip'},
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+
+    async def close(self):
+        """Close the pool of connections."""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def request(self, **params):
+        """Send an OAI-PMH request.
+
+        :returns: Root element of the OAI-PMH response.
+        """
+        await self.open()
+        if self.throttle is not None:
+            wait = await asyncio.get_running_loop().run_in_executor(
+                None, self.throttle)
+            if wait:
+                await asyncio.sleep(wait)
+        async with self.session.get(self.endpoint, params=params) as resp:
+            resp.raise_for_status()
+            content = await resp.read()
+        root = etree.fromstring(content, parser=self.parser)
+        error = root.find(OAI_NAMESPACE + 'error')
+        if error is not None:
+            code = error.get('code', '')
+            exception = getattr(oaiexceptions, code[:1].upper() + code[1:],
+                                oaiexceptions.OAIError)
+            raise exception(error.text)
+        return root
+
+    def list_records(self, **params):
+        """Iterate over the records of a ListRecords request.
+
+        :returns: Asynchronous iterator of ``(token, record)`` tuples, where
+            ``token`` is the resumption token which requested the page of
+            the record (``None`` for the first page) and ``record`` the
+            serialized XML (or element) of the record.
+        """
+        return OAIListIterator(self, 'ListRecords', 'record', params)
+
+    def list_identifiers(self, **params):
+        """Iterate over the headers of a ListIdentifiers request.
+
+        :returns: Asynchronous iterator of ``(token, header)`` tuples, see
+            :meth:`list_records`.
+        """
+        return OAIListIterator(self, 'ListIdentifiers', 'header', params)
+
+    async def get_record(self, identifier, metadataPrefix='oaf'):
+        """Get a single record.
+
+        :returns: Serialized XML (or element) of the record.
+        """
+        root = await self.request(verb='GetRecord', identifier=identifier,
+                                  metadataPrefix=metadataPrefix)
+        record = root.find('{0}GetRecord/{0}record'.format(OAI_NAMESPACE))
+        return self._item(record)
+
+    def _item(self, element):
+        """Get an item returned by the client from its element."""
+        if self.serialize:
+            return etree.tostring(element, encoding='unicode')
+        return element
+
+
+class OAIListIterator(object):
+    """Asynchronous iterator over the items of an OAI-PMH list request.
+
+    The pages are requested one after the other, following the resumption
+    tokens.
+    """
+
+    def __init__(self, client, verb, element, params):
+        """Init the iterator."""
+        self.client = client
+        self.verb = verb
+        self.element = element
+        self.token = params.get('resumptionToken')
+        self.params = params
+        self.items = []
+        self.next_token = None
+        self.done = False
+
+    def __aiter__(self):
+        """Return the iterator."""
+        return self
+
+    async def __anext__(self):
+        """Return the next item, request the next page if needed."""
+        while not self.items:
+            if self.done:
+                raise StopAsyncIteration
+            await self.fetch_page()
+        return self.items.pop(0)
+
+    async def fetch_page(self):
+        """Request the next page of items."""
+        if self.next_token:
+            self.token = self.next_token
+            params = dict(resumptionToken=self.next_token)
+        else:
+            params = self.params
+        root = await self.client.request(verb=self.verb, **params)
+        page = root.find(OAI_NAMESPACE + self.verb)
+        if page is None:
+            raise oaiexceptions.OAIError(
+                "Response without the {0} element.".format(self.verb))
+        token = page.find(OAI_NAMESPACE + 'resumptionToken')
+        self.next_token = token.text if token is not None else None
+        self.done = not self.next_token
+        self.items = [
+            (self.token, self.client._item(item))
+            for item in page.iterfind(OAI_NAMESPACE + self.element)
+        ]
+
+
+async def harvest_sets(client, setspecs, callback, concurrency=None,
+                       **params):
+    """Harvest the records of independent sets concurrently.
+
+    The sets share the connections of the client, e.g. at most
+    ``client.concurrency`` pages are requested at the same time. An error
+    only stops the harvest of its set.
+
+    :param setspecs: Sets to harvest, or dictionary mapping the sets to the
+        arguments of their ListRecords requests, e.g. the resumption token
+        of an interrupted harvest, which replace ``params``.
+    :param callback: Callable invoked with the set, the token of the page
+        and every record.
+    :param concurrency: Maximum number of sets harvested at the same time
+        (default: all of them).
+    :param params: Arguments of the ListRecords requests.
+    :returns: Dictionary mapping the sets to their number of records, or to
+        the exception which stopped their harvest.
+    """
+    semaphore = asyncio.Semaphore(concurrency or len(setspecs) or 1)
+
+    async def harvest_set(setspec):
+        set_params = setspecs[setspec] if isinstance(setspecs, dict) \
+            else dict(params, set=setspec)
+        count = 0
+        async with semaphore:
+            try:
+                async for token, record in client.list_records(**set_params):
+                    callback(setspec, token, record)
+                    count += 1
+            except oaiexceptions.NoRecordsMatch:
+                pass
+        return count
+
+    results = await asyncio.gather(*(harvest_set(s) for s in setspecs),
+                                   return_exceptions=True)
+    return dict(zip(setspecs, results))
+
+
+def run_async_iterator(aiterator, loop=None):
+    """Iterate over an asynchronous iterator from synchronous code.
+
+    :param loop: Event loop running the iterator (default: a new event loop,
+        closed at the end of the iteration).
+    """
+    own_loop = loop is None
+    loop = loop or asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(aiterator.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        if own_loop:
+            loop.close()
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016-2019 CERN.
+#
+# Invenio is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Proxy objects for easier access to application objects."""
+
+from __future__ import absolute_import, print_function
+
+from flask import current_app
+from werkzeug.local import LocalProxy
+
+current_openaire = LocalProxy(
+    lambda: current_app.extensions['invenio-openaire'])
+"""Proxy to the current Invenio-OpenAIRE extension."""
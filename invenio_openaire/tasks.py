@@ -11,84 +11,667 @@
 from __future__ import absolute_import, print_function
 
 from copy import deepcopy
+from datetime import datetime
+from itertools import islice
 
-from celery import chain, shared_task
+from celery import chain, chord, shared_task, signature
+from celery.result import AsyncResult, ResultSet
 from flask import current_app
 from invenio_db import db
 from invenio_indexer.api import RecordIndexer
-from invenio_pidstore.errors import PIDDoesNotExistError
-from invenio_pidstore.resolver import Resolver
+from invenio_indexer.tasks import process_bulk_queue
+from invenio_pidstore.errors import PIDAlreadyExists
+from invenio_pidstore.models import PersistentIdentifier, PIDStatus
 from invenio_records.api import Record
+from invenio_records.models import RecordMetadata
+from sickle.oaiexceptions import BadResumptionToken
 
 from .loaders import LocalFundRefLoader, LocalOAIRELoader, \
-    RemoteFundRefLoader, RemoteOAIRELoader
-from .minters import funder_minter, grant_minter
+    RemoteFundRefLoader, RemoteOAIRELoader, content_hash
+from .minters import funder_minter, grant_bulk_minter, grant_minter
+from .models import ContentHash, HarvestState, RequestBudget
+from .proxies import current_openaire
 
 
 @shared_task(ignore_result=True)
-def harvest_fundref(source=None):
-    """Harvest funders from FundRef and store as authority records."""
-    loader = LocalFundRefLoader(source=source) if source \
-        else RemoteFundRefLoader()
+def harvest_fundref(source=None, defer_indexing=None, force=False):
+    """Harvest funders from FundRef and store as authority records.
+
+    Without a source, the remote registry is only harvested if it changed
+    since the last successful harvest.
+
+    :param defer_indexing: Queue the records for bulk indexing and flush the
+        queue at the end of the harvest instead of indexing every record
+        right away (default: ``OPENAIRE_DEFER_INDEXING``).
+    :param force: Harvest the remote registry even if it is unchanged.
+    """
+    defer_indexing = _defer_indexing(defer_indexing)
+    if source:
+        loader = LocalFundRefLoader(source=source, stream=True)
+    else:
+        loader = RemoteFundRefLoader(stream=True)
+        if not force and not loader.is_modified():
+            current_app.logger.info(
+                "FundRef registry unchanged since the last harvest.")
+            return
+    # The remote registry is only marked as loaded once all its funders
+    # are registered.
+    task_ids = [] if defer_indexing or not source else None
     for funder_json in loader.iter_funders():
-        register_funder.delay(funder_json)
+        send_registration(register_funder, (funder_json, ), task_ids,
+                          defer_indexing=defer_indexing)
+    if task_ids is not None:
+        wait_for_registrations.delay(
+            task_ids, flush_bulk_queue=defer_indexing,
+            callback=None if source else
+            mark_fundref_loaded.si(loader.checksum))
 
 
 @shared_task(ignore_result=True)
-def harvest_openaire_projects(source=None, setspec=None):
-    """Harvest grants from OpenAIRE and store as authority records."""
-    loader = LocalOAIRELoader(source=source) if source \
-        else RemoteOAIRELoader(setspec=setspec)
-    for grant_json in loader.iter_grants():
-        register_grant.delay(grant_json)
+def mark_fundref_loaded(checksum):
+    """Store the checksum of the FundRef registry as successfully loaded."""
+    RemoteFundRefLoader(stream=True).mark_loaded(checksum=checksum)
+
+
+@shared_task(ignore_result=True)
+def harvest_openaire_projects(source=None, setspec=None, defer_indexing=None,
+                              incremental=False, resume=True):
+    """Harvest grants from OpenAIRE and store as authority records.
+
+    The progress of remote harvests is checkpointed per set after every
+    chunk of grants, and the start time of every successful remote harvest
+    is stored per set.
+
+    :param defer_indexing: Flush the bulk indexing queue once all the grants
+        are registered instead of after every chunk of grants
+        (default: ``OPENAIRE_DEFER_INDEXING``).
+    :param incremental: Only harvest the grants of the set modified since
+        the last successful harvest of the set.
+    :param resume: Resume an interrupted harvest of the set from its last
+        checkpoint (default: True).
+    """
+    defer_indexing = _defer_indexing(defer_indexing)
+    started = datetime.utcnow()
+    # Resolve the funders known from the stored funder records too.
+    current_openaire.load_funder_index()
+    if source:
+        loader = LocalOAIRELoader(source=source)
+        grants = loader.iter_grants(
+            processes=current_app.config['OPENAIRE_OAI_LOCAL_PROCESSES'])
+    else:
+        setspec = setspec or \
+            current_app.config['OPENAIRE_OAIPMH_DEFAULT_SET']
+        loader, started = _remote_loader(
+            setspec, started, incremental=incremental, resume=resume,
+            throttle=throttle_requests(
+                current_app.config['OPENAIRE_OAIPMH_ENDPOINT']))
+        grants = loader.iter_grants()
+    chunks = chunked(grants, current_app.config['OPENAIRE_GRANTS_CHUNK_SIZE'])
+    task_ids = [] if defer_indexing else None
+    for chunk in chunks:
+        send_registration(register_grants_bulk, (chunk, ), task_ids,
+                          defer_indexing=defer_indexing)
+        if not source:
+            HarvestState.checkpoint(setspec, loader.resumption_token,
+                                    loader.harvested, started,
+                                    from_date=loader.from_date)
+            db.session.commit()
+    if not source:
+        HarvestState.update_lastrun(setspec, started)
+        db.session.commit()
+    if task_ids:
+        wait_for_registrations.delay(task_ids, flush_bulk_queue=True)
+
+
+@shared_task(ignore_result=True)
+def harvest_openaire_sets(setspecs, defer_indexing=None, incremental=False,
+                          resume=True, concurrency=None):
+    """Harvest sets of grants concurrently with the asyncio OAI-PMH client.
+
+    The harvests of the sets run in a single event loop, at most
+    ``concurrency`` of them at the same time (default:
+    ``OPENAIRE_OAIPMH_CONCURRENCY``), and share the connections of the
+    client. Like with :func:`harvest_openaire_projects`, the progress of
+    every set is checkpointed after every chunk of grants, and the start
+    time of every successful harvest is stored per set.
+    """
+    import asyncio
+
+    from .oaipmh import AsyncOAIPMHClient, harvest_sets
+
+    defer_indexing = _defer_indexing(defer_indexing)
+    concurrency = concurrency or \
+        current_app.config['OPENAIRE_OAIPMH_CONCURRENCY']
+    started = datetime.utcnow()
+    current_openaire.load_funder_index()
+    endpoint = current_app.config['OPENAIRE_OAIPMH_ENDPOINT']
+    client = AsyncOAIPMHClient(
+        endpoint, throttle=throttle_requests(endpoint), serialize=False,
+        concurrency=current_app.config['OPENAIRE_OAIPMH_ASYNC_CONCURRENCY'])
+    harvests = {
+        setspec: _remote_loader(setspec, started, incremental=incremental,
+                                resume=resume, backend='asyncio',
+                                client=client)
+        for setspec in setspecs
+    }
+    chunk_size = current_app.config['OPENAIRE_GRANTS_CHUNK_SIZE']
+    chunks = {setspec: [] for setspec in setspecs}
+    task_ids = [] if defer_indexing else None
+
+    def harvested(setspec, token, record):
+        loader, set_started = harvests[setspec]
+        grant = loader.convert_record(token, record)
+        if grant is None:
+            return
+        chunks[setspec].append(grant)
+        if len(chunks[setspec]) == chunk_size:
+            send_registration(register_grants_bulk, (chunks[setspec], ),
+                              task_ids, defer_indexing=defer_indexing)
+            chunks[setspec] = []
+            HarvestState.checkpoint(setspec, loader.resumption_token,
+                                    loader.harvested, set_started,
+                                    from_date=loader.from_date)
+            db.session.commit()
+
+    errors = []
+    restarted = set()
+    pending = list(setspecs)
+    loop = asyncio.new_event_loop()
+    try:
+        while pending:
+            results = loop.run_until_complete(harvest_sets(
+                client,
+                {s: harvests[s][0].list_records_params() for s in pending},
+                harvested, concurrency=concurrency))
+            pending = []
+            for setspec, result in results.items():
+                loader, set_started = harvests[setspec]
+                if isinstance(result, BadResumptionToken) and \
+                        setspec not in restarted:
+                    restarted.add(setspec)
+                    loader.restart()
+                    pending.append(setspec)
+                elif isinstance(result, BaseException):
+                    current_app.logger.error(
+                        "Harvest of set '{0}' failed.".format(setspec),
+                        exc_info=result)
+                    errors.append(result)
+                else:
+                    if chunks[setspec]:
+                        send_registration(
+                            register_grants_bulk, (chunks[setspec], ),
+                            task_ids, defer_indexing=defer_indexing)
+                    HarvestState.update_lastrun(setspec, set_started)
+                    db.session.commit()
+    finally:
+        loop.run_until_complete(client.close())
+        loop.close()
+    if task_ids:
+        wait_for_registrations.delay(task_ids, flush_bulk_queue=True)
+    if errors:
+        raise errors[0]
+
+
+def _remote_loader(setspec, started, incremental=False, resume=True,
+                   **kwargs):
+    """Create the loader of a remote harvest of a set.
+
+    :param started: Start time of the harvest.
+    :param kwargs: Arguments of the
+        :class:`invenio_openaire.loaders.RemoteOAIRELoader`.
+    :returns: Tuple of the loader and the start time of the harvest, which
+        is the start time of the interrupted harvest if it is resumed.
+    """
+    state = HarvestState.get(setspec)
+    if resume and state and state.resumption_token:
+        # Restarted from the same window if the token has expired.
+        return RemoteOAIRELoader(
+            setspec=setspec, from_date=state.from_date,
+            resumption_token=state.resumption_token,
+            harvested=state.harvested, **kwargs), state.started or started
+    from_date = state.lastrun if incremental and state else None
+    return RemoteOAIRELoader(setspec=setspec, from_date=from_date,
+                             **kwargs), started
 
 
 @shared_task(ignore_result=True)
-def harvest_all_openaire_projects():
+def harvest_all_openaire_projects(defer_indexing=None, incremental=False,
+                                  concurrency=None):
     """Reharvest all grants from OpenAIRE.
 
-    Harvest all OpenAIRE grants in a chain to prevent OpenAIRE
-    overloading from multiple parallel harvesting.
+    At most ``concurrency`` sets are harvested at the same time (default:
+    ``OPENAIRE_OAIPMH_CONCURRENCY``): with the ``asyncio`` backend by a
+    single :func:`harvest_openaire_sets` task, or else by as many chains of
+    harvests running in parallel. To prevent OpenAIRE overloading, the
+    requests of all the harvests share the budget of
+    ``OPENAIRE_OAIPMH_RATE_LIMIT`` requests per second.
     """
     setspecs = current_app.config['OPENAIRE_GRANTS_SPECS']
-    chain(harvest_openaire_projects.s(setspec=setspec)
-          for setspec in setspecs).apply_async()
+    concurrency = concurrency or \
+        current_app.config['OPENAIRE_OAIPMH_CONCURRENCY']
+    if current_app.config['OPENAIRE_OAIPMH_BACKEND'] == 'asyncio':
+        harvest_openaire_sets.delay(list(setspecs),
+                                    defer_indexing=defer_indexing,
+                                    incremental=incremental,
+                                    concurrency=concurrency)
+        return
+    for i in range(min(concurrency, len(setspecs))):
+        chain(harvest_openaire_projects.s(setspec=setspec,
+                                          defer_indexing=defer_indexing,
+                                          incremental=incremental)
+              for setspec in setspecs[i::concurrency]).apply_async()
+
+
+def load_grants_sharded(source, shard_size=None, defer_indexing=None,
+                        **filters):
+    """Load the grants of a local OpenAIRE database in shards.
+
+    Every shard is a task loading a range of rows of the database, which
+    must be available at the same path to all the workers. The tasks are
+    grouped in a chord, completed by :func:`grants_shards_loaded`.
+
+    :param shard_size: Number of rows loaded by a task
+        (default: ``OPENAIRE_OAI_LOCAL_SHARD_SIZE``).
+    :param filters: Filters of the grants, see
+        :meth:`invenio_openaire.loaders.LocalOAIRELoader.iter_grants`.
+    :returns: Result of the chord.
+    """
+    defer_indexing = _defer_indexing(defer_indexing)
+    shard_size = shard_size or \
+        current_app.config['OPENAIRE_OAI_LOCAL_SHARD_SIZE']
+    loader = LocalOAIRELoader(source=source)
+    shards = list(loader.rowid_ranges(shard_size))
+    loader._disconnect()
+    return chord(
+        register_grants_shard.s(source, start, end,
+                                defer_indexing=defer_indexing, **filters)
+        for start, end in shards
+    )(grants_shards_loaded.s(source, defer_indexing=defer_indexing))
+
+
+@shared_task
+def register_grants_shard(source, start, end, defer_indexing=False,
+                          **filters):
+    """Register the grants of a range of rows of a local OpenAIRE database.
+
+    :returns: Number of grants in the range.
+    """
+    # Resolve the funders known from the stored funder records too.
+    current_openaire.load_funder_index()
+    loader = LocalOAIRELoader(source=source)
+    grants = loader.convert_range(start, end, **filters)
+    chunk_size = current_app.config['OPENAIRE_GRANTS_CHUNK_SIZE']
+    for chunk in chunked(grants, chunk_size):
+        # The records of all the chunks are indexed together.
+        create_or_update_records(chunk, 'grant', 'internal_id',
+                                 grant_bulk_minter, defer_indexing=True)
+    if not defer_indexing:
+        process_bulk_queue.delay()
+    return len(grants)
+
+
+@shared_task(ignore_result=True)
+def grants_shards_loaded(counts, source, defer_indexing=False):
+    """Report the completion of the sharded loading of the grants."""
+    if defer_indexing:
+        process_bulk_queue.delay()
+    current_app.logger.info(
+        "Loaded {0} grants from '{1}' in {2} shards.".format(
+            sum(counts), source, len(counts)))
 
 
 @shared_task(ignore_result=True)
-def register_funder(data):
+def register_funder(data, defer_indexing=False):
     """Register the funder JSON in records and create a PID."""
-    create_or_update_record(data, 'frdoi', 'doi', funder_minter)
+    create_or_update_record(data, 'frdoi', 'doi', funder_minter,
+                            defer_indexing=defer_indexing)
 
 
 @shared_task(ignore_result=True, rate_limit='20/s')
-def register_grant(data):
+def register_grant(data, defer_indexing=False):
     """Register the grant JSON in records and create a PID."""
-    create_or_update_record(data, 'grant', 'internal_id', grant_minter)
+    create_or_update_record(data, 'grant', 'internal_id', grant_minter,
+                            defer_indexing=defer_indexing)
+
+
+@shared_task(ignore_result=True)
+def register_grants_bulk(data, defer_indexing=False):
+    """Register a chunk of grant JSONs in records and create their PIDs."""
+    create_or_update_records(data, 'grant', 'internal_id', grant_bulk_minter,
+                             defer_indexing=defer_indexing)
+
+
+def send_registration(task, args, task_ids=None, **kwargs):
+    """Send a registration task, e.g. of :func:`register_grants_bulk`.
+
+    :param task_ids: List of the ids of the tasks to wait for, see
+        :func:`wait_for_registrations`. The id of the task is appended and
+        its result is stored (default: the result is ignored).
+    """
+    result = task.apply_async(args, kwargs, ignore_result=task_ids is None)
+    if task_ids is not None:
+        task_ids.append(result.id)
+    return result
+
+
+@shared_task(bind=True, ignore_result=True, max_retries=None)
+def wait_for_registrations(self, task_ids, flush_bulk_queue=False,
+                           callback=None):
+    """Complete a harvest once its registration tasks completed.
+
+    Unlike a chord callback, the task only carries the ids of the tasks,
+    whose results are checked again every
+    ``OPENAIRE_REGISTRATIONS_POLL_INTERVAL`` seconds until all of them are
+    ready.
+
+    :param task_ids: Ids of the registration tasks, sent with their results
+        stored, see :func:`send_registration`.
+    :param flush_bulk_queue: Flush the bulk indexing queue, where the tasks
+        queued their records.
+    :param callback: Signature of a task sent once all the tasks succeeded.
+    """
+    succeeded = True
+    # Eager tasks have completed when sent.
+    if not self.request.is_eager:
+        results = ResultSet([AsyncResult(task_id) for task_id in task_ids])
+        if not results.ready():
+            raise self.retry(countdown=current_app.config[
+                'OPENAIRE_REGISTRATIONS_POLL_INTERVAL'])
+        succeeded = results.successful()
+        if not succeeded:
+            current_app.logger.warning(
+                "{0} of {1} registration tasks failed.".format(
+                    sum(1 for r in results.results if r.failed()),
+                    len(task_ids)))
+        results.forget()
+    if flush_bulk_queue:
+        process_bulk_queue.delay()
+    if callback is not None and succeeded:
+        signature(callback).delay()
 
 
-def create_or_update_record(data, pid_type, id_key, minter):
-    """Register a funder or grant."""
-    resolver = Resolver(
-        pid_type=pid_type, object_type='rec', getter=Record.get_record)
+def _defer_indexing(defer_indexing=None):
+    """Get the indexing mode, falling back to the configured default."""
+    if defer_indexing is None:
+        return current_app.config['OPENAIRE_DEFER_INDEXING']
+    return defer_indexing
 
+
+def throttle_requests(endpoint):
+    """Get a throttle reserving requests from the budget of an endpoint.
+
+    The throttle runs in the application context, also when invoked from
+    another thread.
+
+    :returns: Callable to invoke before every request to the endpoint,
+        returning the number of seconds to wait before sending it, or
+        ``None`` if ``OPENAIRE_OAIPMH_RATE_LIMIT`` is not set.
+    """
+    rate = current_app.config['OPENAIRE_OAIPMH_RATE_LIMIT']
+    if not rate:
+        return None
+    burst = current_app.config['OPENAIRE_OAIPMH_RATE_BURST']
+    app = current_app._get_current_object()
+
+    def throttle():
+        with app.app_context():
+            return RequestBudget.consume(endpoint, rate, burst=burst)
+    return throttle
+
+
+def chunked(iterable, size):
+    """Split an iterable into lists of at most ``size`` items."""
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def is_modified(record, data, data_hash, record_hash=None):
+    """Check if the metadata of a stored record differs from the new data.
+
+    The content hashes are compared when the stored record has one,
+    otherwise the whole metadata is compared.
+
+    :param data_hash: Content hash of the new data.
+    :param record_hash: Stored content hash of the record, see
+        :class:`invenio_openaire.models.ContentHash`.
+    """
+    if record_hash:
+        return data_hash != record_hash
+    data_c = deepcopy(data)
+    data_c.pop('remote_modified', None)
+    record_c = deepcopy(record)
+    record_c.pop('remote_modified', None)
+    # All grants on OpenAIRE are modified periodically even if nothing
+    # has changed. We need to check for actual differences in the metadata
+    return data_c != record_c
+
+
+def resolve_records(pid_type, pid_values):
+    """Resolve many PIDs of the same type to their records in one query.
+
+    :param pid_type: PID type, e.g. ``grant`` or ``frdoi``.
+    :param pid_values: PID values, e.g. the ``internal_id`` of grants or the
+        ``doi`` of funders.
+    :returns: Dictionary mapping the values of the registered PIDs to
+        ``(pid, record)`` tuples. Unknown values and the values of the PIDs
+        which are not registered (e.g. deleted) are left out.
+    """
+    if not pid_values:
+        return {}
+    query = db.session.query(PersistentIdentifier, RecordMetadata).join(
+        RecordMetadata,
+        RecordMetadata.id == PersistentIdentifier.object_uuid,
+    ).filter(
+        PersistentIdentifier.pid_type == pid_type,
+        PersistentIdentifier.object_type == 'rec',
+        PersistentIdentifier.status == PIDStatus.REGISTERED,
+        PersistentIdentifier.pid_value.in_(pid_values),
+        RecordMetadata.json != None,  # noqa
+    )
+    return {pid.pid_value: (pid, Record(model.json, model=model))
+            for pid, model in query}
+
+
+def resolve_content_hashes(pid_type, pid_values):
+    """Resolve many PIDs of the same type to their stored content hashes.
+
+    Unlike :func:`resolve_records`, the metadata of the records is not
+    fetched.
+
+    :returns: Dictionary mapping the values of the registered PIDs to
+        ``(record_id, content_hash)`` tuples, where ``content_hash`` is
+        ``None`` if the record has no stored content hash.
+    """
+    if not pid_values:
+        return {}
+    query = db.session.query(
+        PersistentIdentifier.pid_value, PersistentIdentifier.object_uuid,
+        ContentHash.content_hash,
+    ).join(
+        RecordMetadata,
+        RecordMetadata.id == PersistentIdentifier.object_uuid,
+    ).outerjoin(
+        ContentHash,
+        ContentHash.id == PersistentIdentifier.object_uuid,
+    ).filter(
+        PersistentIdentifier.pid_type == pid_type,
+        PersistentIdentifier.object_type == 'rec',
+        PersistentIdentifier.status == PIDStatus.REGISTERED,
+        PersistentIdentifier.pid_value.in_(pid_values),
+        RecordMetadata.json != None,  # noqa
+    )
+    return {pid_value: (record_id, record_hash)
+            for pid_value, record_id, record_hash in query}
+
+
+def unregistered_pids(pid_type, pid_values):
+    """Get the PIDs of the same type which exist but are not registered.
+
+    Such PIDs, e.g. deleted or redirected, are neither updated nor minted
+    again by the registration of funders and grants.
+
+    :returns: Dictionary mapping the values of the PIDs to their status.
+    """
+    if not pid_values:
+        return {}
+    query = db.session.query(
+        PersistentIdentifier.pid_value, PersistentIdentifier.status,
+    ).filter(
+        PersistentIdentifier.pid_type == pid_type,
+        PersistentIdentifier.status != PIDStatus.REGISTERED,
+        PersistentIdentifier.pid_value.in_(pid_values),
+    )
+    return dict(query)
+
+
+def skip_unregistered(pid_type, pid_value, status):
+    """Log the registration skipped because of an unregistered PID."""
+    current_app.logger.warning("Skipping {0} '{1}' with a {2} PID.".format(
+        pid_type, pid_value, status.name.lower()))
+
+
+def create_or_update_records(data, pid_type, id_key, bulk_minter,
+                             defer_indexing=False):
+    """Register a batch of funders or grants in a single transaction.
+
+    PIDs of the whole batch are resolved with a single query, the PIDs of
+    the created records are minted together and the created or updated
+    records are indexed with a single bulk request. With ``defer_indexing``
+    the records are only queued for bulk indexing.
+
+    If any PID of the batch already exists, the transaction is rolled back
+    and the batch is registered again record by record, skipping the
+    records with conflicting PIDs.
+
+    :param bulk_minter: Minter of the PIDs of many records, e.g.
+        :func:`invenio_openaire.minters.grant_bulk_minter`.
+    """
     try:
-        pid, record = resolver.resolve(data[id_key])
-        data_c = deepcopy(data)
-        del data_c['remote_modified']
-        record_c = deepcopy(record)
-        del record_c['remote_modified']
-        # All grants on OpenAIRE are modified periodically even if nothing
-        # has changed. We need to check for actual differences in the metadata
-        if data_c != record_c:
+        record_ids = register_records(data, pid_type, id_key, bulk_minter)
+    except PIDAlreadyExists:
+        db.session.rollback()
+        record_ids = set()
+        for item in data:
+            try:
+                record_ids |= register_records([item], pid_type, id_key,
+                                               bulk_minter)
+            except PIDAlreadyExists as e:
+                db.session.rollback()
+                current_app.logger.warning(
+                    "Skipping {0} '{1}' with the existing PID {2}:{3}."
+                    .format(pid_type, item[id_key], e.pid_type, e.pid_value))
+
+    if record_ids:
+        indexer = RecordIndexer()
+        indexer.bulk_index(list(record_ids))
+        if not defer_indexing:
+            indexer.process_bulk_queue()
+
+
+def register_records(data, pid_type, id_key, bulk_minter):
+    """Create or update the records of a batch and commit them.
+
+    :raises invenio_pidstore.errors.PIDAlreadyExists: If a PID of the
+        created records already exists, without committing.
+    :returns: Identifiers of the created or updated records.
+    """
+    pid_values = [d[id_key] for d in data]
+    item_hashes = [content_hash(item) for item in data]
+    hashes = {
+        pid_value: record_hash for pid_value, (_, record_hash) in
+        resolve_content_hashes(pid_type, pid_values).items()
+    }
+    unregistered = unregistered_pids(pid_type, pid_values)
+    # Only the records whose content hash is missing or differs are fetched.
+    existing = {
+        pid_value: record for pid_value, (pid, record) in resolve_records(
+            pid_type, [pid_value for pid_value, item_hash in
+                       zip(pid_values, item_hashes)
+                       if pid_value in hashes and
+                       hashes[pid_value] != item_hash]).items()
+    }
+
+    record_ids = set()
+    created = []
+    # Roll back the whole chunk on a PID conflict
+    with db.session.begin_nested():
+        for item, item_hash in zip(data, item_hashes):
+            pid_value = item[id_key]
+            if pid_value in unregistered:
+                skip_unregistered(pid_type, pid_value,
+                                  unregistered[pid_value])
+                continue
+            elif pid_value not in hashes:
+                record = Record.create(item)
+                created.append((record.id, item))
+                existing[pid_value] = record
+                ContentHash.set(record.id, item_hash, created=True)
+            elif hashes[pid_value] == item_hash:
+                continue
+            elif is_modified(existing[pid_value], item, item_hash,
+                             hashes[pid_value]):
+                record = existing[pid_value]
+                record.update(item)
+                record.commit()
+                ContentHash.set(record.id, item_hash)
+            else:
+                # Stored without a content hash
+                ContentHash.set(existing[pid_value].id, item_hash)
+                hashes[pid_value] = item_hash
+                continue
+            hashes[pid_value] = item_hash
+            record_ids.add(str(record.id))
+        if created:
+            bulk_minter(created)
+    db.session.commit()
+    return record_ids
+
+
+def index_record(record_id, defer_indexing=False):
+    """Index a record or queue it for deferred bulk indexing."""
+    if defer_indexing:
+        RecordIndexer().bulk_index([str(record_id)])
+    else:
+        RecordIndexer().index_by_id(str(record_id))
+
+
+def create_or_update_record(data, pid_type, id_key, minter,
+                            defer_indexing=False):
+    """Register a funder or grant.
+
+    The stored record is only fetched if its content hash is missing or
+    differs from the one of the data.
+    """
+    resolved = resolve_content_hashes(
+        pid_type, [data[id_key]]).get(data[id_key])
+    unregistered = unregistered_pids(pid_type, [data[id_key]])
+    data_hash = content_hash(data)
+    if unregistered:
+        skip_unregistered(pid_type, data[id_key], unregistered[data[id_key]])
+    elif resolved and resolved[1] == data_hash:
+        # Unchanged, without fetching the record
+        pass
+    elif resolved:
+        record_hash = resolved[1]
+        pid, record = resolve_records(pid_type, [data[id_key]])[data[id_key]]
+        if is_modified(record, data, data_hash, record_hash):
             record.update(data)
             record.commit()
             record_id = record.id
+            ContentHash.set(record_id, data_hash)
+            db.session.commit()
+            index_record(record_id, defer_indexing=defer_indexing)
+        else:
+            # Stored without a content hash
+            ContentHash.set(record.id, data_hash)
             db.session.commit()
-            RecordIndexer().index_by_id(str(record_id))
-    except PIDDoesNotExistError:
+    else:
         record = Record.create(data)
         record_id = record.id
         minter(record.id, data)
+        ContentHash.set(record_id, data_hash, created=True)
         db.session.commit()
-        RecordIndexer().index_by_id(str(record_id))
+        index_record(record_id, defer_indexing=defer_indexing)
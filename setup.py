@@ -26,6 +26,9 @@ tests_require = [
 invenio_search_version = '1.2.0'
 
 extras_require = {
+    'asyncio': [
+        'aiohttp>=3.6.0;python_version>="3.6"',
+    ],
     'docs': [
         'Sphinx>=3',
     ],
@@ -105,6 +108,12 @@ setup(
         'invenio_celery.tasks': [
             'invenio_openaire = invenio_openaire.tasks',
         ],
+        'invenio_db.alembic': [
+            'invenio_openaire = invenio_openaire:alembic',
+        ],
+        'invenio_db.models': [
+            'invenio_openaire = invenio_openaire.models',
+        ],
         'invenio_i18n.translations': [
             'invenio_openaire = invenio_openaire',
         ],
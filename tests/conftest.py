@@ -14,6 +14,8 @@ from __future__ import absolute_import, print_function
 import os
 import shutil
 import tempfile
+import uuid
+from io import BytesIO
 from os.path import dirname, join
 
 import pytest
@@ -28,11 +30,15 @@ from invenio_indexer import InvenioIndexer
 from invenio_indexer.api import RecordIndexer
 from invenio_jsonschemas import InvenioJSONSchemas
 from invenio_pidstore import InvenioPIDStore
+from invenio_pidstore.models import PersistentIdentifier
 from invenio_records import InvenioRecords
+from invenio_records.api import Record
 from invenio_records.models import RecordMetadata
 from invenio_records_rest.utils import PIDConverter, PIDPathConverter
 from invenio_search import InvenioSearch, current_search
 from invenio_search.errors import IndexAlreadyExistsError
+from lxml import etree
+from sickle.oaiexceptions import BadResumptionToken, NoRecordsMatch
 from sqlalchemy_utils.functions import create_database, database_exists
 
 from invenio_openaire import InvenioOpenAIRE
@@ -43,8 +49,14 @@ class MockSickle(object):
     """Mock of the OAI-PMH harvester.
 
     Load the grant XML data from file and mock the Sickle datatype.
+    Records are split into pages of ``page_size`` records, linked with
+    resumption tokens, and parsed as part of the response of their page.
+    Harvesting fails after ``fail_after`` records.
     """
 
+    page_size = None
+    fail_after = None
+
     def __init__(self, source):
         """Initialize the harvester."""
         self.source = source
@@ -55,14 +67,116 @@ class MockSickle(object):
     class MockRecordType(object):
         """Mock the OAI-PMH data type."""
 
-        def __init__(self, raw_data):
+        def __init__(self, xml):
             """Init the data type."""
-            self.raw = raw_data
-
-    def ListRecords(self, metadataPrefix=None, set=None):
+            self.xml = xml
+
+        @property
+        def raw(self):
+            """Return the XML of the record."""
+            return etree.tounicode(self.xml)
+
+    class MockResumptionToken(object):
+        """Mock the OAI-PMH resumption token."""
+
+        def __init__(self, token):
+            """Init the token."""
+            self.token = token
+
+    class MockRecordIterator(object):
+        """Mock the paginated OAI-PMH record iterator."""
+
+        def __init__(self, sickle, records, start, page_size, fail_after):
+            """Init the iterator and fetch the first page."""
+            self.sickle = sickle
+            self.records = records
+            self.page_size = page_size or len(records)
+            self.fail_after = fail_after
+            self.count = 0
+            self._fetch_page(start)
+
+        def _fetch_page(self, offset):
+            self.sickle.harvest(resumptionToken=str(offset))
+            end = offset + self.page_size
+            response = etree.fromstring(
+                '<oai:OAI-PMH xmlns:oai="{0}"><oai:ListRecords>{1}'
+                '</oai:ListRecords></oai:OAI-PMH>'.format(
+                    'http://www.openarchives.org/OAI/2.0/',
+                    ''.join(self.records[offset:end])))
+            self.page = [MockSickle.MockRecordType(xml)
+                         for xml in response[0]]
+            self.resumption_token = MockSickle.MockResumptionToken(
+                str(end)) if end < len(self.records) else None
+
+        def __iter__(self):
+            """Return the iterator."""
+            return self
+
+        def __next__(self):
+            """Return the next record, fetch the next page if needed."""
+            if self.fail_after is not None and self.count >= self.fail_after:
+                raise IOError("Connection lost.")
+            if not self.page and self.resumption_token:
+                self._fetch_page(int(self.resumption_token.token))
+            if not self.page:
+                raise StopIteration()
+            self.count += 1
+            return self.page.pop(0)
+
+        next = __next__
+
+    def harvest(self, **kwargs):
+        """Mock an OAI-PMH request."""
+
+    def ListRecords(self, metadataPrefix=None, set=None, **kwargs):
         """Record list generator."""
-        for grant_xml in self.data:
-            yield self.MockRecordType(grant_xml)
+        from_date = kwargs.get('from')
+        token = kwargs.get('resumptionToken')
+        records = [
+            grant_xml.strip() for grant_xml in self.data
+            if not from_date or grant_xml.split(
+                '<oai:datestamp>')[1][:len(from_date)] >= from_date
+        ]
+        if not records:
+            raise NoRecordsMatch()
+        if token is not None and not token.isdigit():
+            raise BadResumptionToken()
+        return self.MockRecordIterator(self, records, int(token or 0),
+                                       self.page_size, self.fail_after)
+
+
+class mock_requests(object):
+    """Mock the requests library.
+
+    Conditional requests matching the ``etag`` of the registry get a
+    ``304 Not Modified`` response.
+    """
+
+    etag = '"1"'
+
+    class MockResponse(object):
+        """Mock of the Response object."""
+
+        def __init__(self, text, status_code=200, headers=None):
+            """Init the response mock with fixed text."""
+            self.text = text
+            self.raw = BytesIO(text.encode('utf-8'))
+            self.status_code = status_code
+            self.headers = headers or {}
+
+        def raise_for_status(self):
+            """Mock the status check."""
+
+    @classmethod
+    def get(cls, source, stream=True, headers=None):
+        """Mock the get method."""
+        if (headers or {}).get('If-None-Match') == cls.etag:
+            return cls.MockResponse('', status_code=304)
+        testdata_path = os.path.join(os.path.dirname(__file__),
+                                     'testdata/fundref_test.rdf')
+        with open(testdata_path, 'r') as F:
+            data = F.read()
+        return cls.MockResponse(data, headers={'ETag': cls.etag})
 
 
 @pytest.yield_fixture()
@@ -75,6 +189,8 @@ def app(request):
         SQLALCHEMY_DATABASE_URI=os.environ.get(
             'SQLALCHEMY_DATABASE_URI', 'sqlite:///test.db'),
         INDEXER_REPLACE_REFS=True,
+        BROKER_URL='memory://',
+        CELERY_BROKER_URL='memory://',
         CELERY_ALWAYS_EAGER=True,
         CELERY_RESULT_BACKEND="cache",
         CELERY_CACHE_BACKEND="memory",
@@ -139,6 +255,16 @@ def funders(app, es, db):
     harvest_fundref(source='tests/testdata/fundref_test.rdf')
 
 
+@pytest.yield_fixture()
+def funder_record(db):
+    """Funder record of the grants of the mock OAI-PMH harvester."""
+    recuuid = uuid.uuid4()
+    PersistentIdentifier.create(
+        'frdoi', '10.13039/501100000925',
+        object_type='rec', object_uuid=recuuid, status='R')
+    yield Record.create({'acronyms': ['EC']}, id_=recuuid)
+
+
 @pytest.yield_fixture()
 def grants(app, es, db, funders):
     """Grant records fixture."""
@@ -14,8 +14,10 @@ from os.path import dirname, join
 
 from click.testing import CliRunner
 from invenio_pidstore.models import PersistentIdentifier
+from mock import patch
 
 from invenio_openaire.cli import openaire
+from invenio_openaire.proxies import current_openaire
 
 
 def test_loadfunders(script_info, es):
@@ -44,3 +46,50 @@ def test_loadgrants(script_info, es, funders):
     print(result.output)
     assert result.exit_code == 0
     assert PersistentIdentifier.query.count() == 46
+
+
+def test_loadgrants_funder_index(app, script_info, es, funders):
+    """Test resolving the funders known from the stored records only."""
+    app.config['OPENAIRE_FIXED_FUNDERS'] = {}
+    current_openaire._funder_index = None
+    runner = CliRunner()
+    result = runner.invoke(
+        openaire,
+        ['loadgrants', '--source',
+         join(dirname(__file__), 'testdata/openaire_test.sqlite')],
+        obj=script_info)
+    assert result.exit_code == 0
+    assert PersistentIdentifier.query.count() == 46
+
+
+def test_loadgrants_sharded(script_info, es, funders):
+    """Test CLI for loading grants in shards."""
+    runner = CliRunner()
+    result = runner.invoke(
+        openaire,
+        ['loadgrants', '--sharded', '--source',
+         join(dirname(__file__), 'testdata/openaire_test.sqlite')],
+        obj=script_info)
+    assert result.exit_code == 0
+    assert PersistentIdentifier.query.count() == 46
+
+
+def test_loadgrants_defer_indexing(app, script_info, es, funders):
+    """Test the CLI option of the deferred indexing."""
+    app.config['OPENAIRE_DEFER_INDEXING'] = True
+    source = join(dirname(__file__), 'testdata/openaire_test.sqlite')
+    runner = CliRunner()
+    with patch('invenio_openaire.cli.wait_for_registrations') as wait:
+        result = runner.invoke(
+            openaire, ['loadgrants', '--no-defer-indexing', '--source',
+                       source], obj=script_info)
+        assert result.exit_code == 0
+        assert not wait.called
+        assert PersistentIdentifier.query.count() == 46
+
+        result = runner.invoke(
+            openaire, ['loadgrants', '--source', source], obj=script_info)
+        assert result.exit_code == 0
+        assert wait.delay.call_count == 1
+        task_ids, = wait.delay.call_args[0]
+        assert len(task_ids) == 1
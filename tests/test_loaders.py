@@ -11,39 +11,27 @@
 
 from __future__ import absolute_import, print_function
 
+import json
 import os
+import sqlite3
+import threading
+import time
 import uuid
+from datetime import date, datetime
 
 import pytest
-from conftest import MockSickle
+from conftest import MockSickle, mock_requests
 from invenio_pidstore.models import PersistentIdentifier
 from invenio_records.api import Record
+from lxml import etree
 from mock import patch
 
 from invenio_openaire.errors import FunderNotFoundError, OAIRELoadingError
-from invenio_openaire.loaders import FundRefDOIResolver, GeoNamesResolver, \
-    LocalFundRefLoader, LocalOAIRELoader, OAIREDumper, RemoteFundRefLoader, \
-    RemoteOAIRELoader
-
-
-class mock_requests(object):
-    """Mock the requests library."""
-
-    class MockResponse(object):
-        """Mock of the Response object."""
-
-        def __init__(self, text):
-            """Init the response mock with fixed text."""
-            self.text = text
-
-    @classmethod
-    def get(cls, source, stream=True, headers=None):
-        """Mock the get method."""
-        testdata_path = os.path.join(os.path.dirname(__file__),
-                                     'testdata/fundref_test.rdf')
-        with open(testdata_path, 'r') as F:
-            data = F.read()
-        return cls.MockResponse(data)
+from invenio_openaire.loaders import FundRefDOIResolver, GeoNamesIndex, \
+    GeoNamesResolver, LocalFundRefLoader, LocalOAIRELoader, OAIREDumper, \
+    RemoteFundRefLoader, RemoteOAIRELoader, content_hash, \
+    dump_schema_version, iter_funder_records, load_funder_names
+from invenio_openaire.proxies import current_openaire
 
 
 def test_cc_resolver(app):
@@ -58,6 +46,25 @@ def test_cc_resolver(app):
     assert resolver.cc_from_id('1') == 'US'
 
 
+def test_geonames_index(app):
+    """Test the compact GeoNames country code index."""
+    resolver = GeoNamesResolver()
+    index = resolver.cc_data
+    assert isinstance(index, GeoNamesIndex)
+    assert GeoNamesResolver().cc_data is index
+    assert len(index) == 327895
+    assert index['3038817'] == 'AD'
+    assert index[8502121] == 'US'
+    for geonames_id in ('1', '99999999', 'foo'):
+        pytest.raises(KeyError, resolver.cc_from_id, geonames_id)
+
+    index = GeoNamesIndex.from_file(resolver.cc_fname)
+    with open(resolver.cc_fname, 'r') as F:
+        for line in F:
+            geonames_id, code = line.rstrip('\n').split(',')
+            assert index[geonames_id] == code
+
+
 def test_local_fundref_loader(app):
     """Test the loadef for the FundRef dataset."""
     # Test loading the real FundRef dataset.
@@ -121,6 +128,62 @@ def test_remote_fundref_loader(app):
     assert len(json_dataset) == 5
 
 
+@patch('invenio_openaire.loaders.requests', mock_requests)
+def test_remote_fundref_loader_cache(app, tmpdir):
+    """Test the download cache of the remote FundRef loader."""
+    cache_dir = str(tmpdir.join('cache'))
+    expected = list(RemoteFundRefLoader().iter_funders())
+    frl = RemoteFundRefLoader(cache_dir=cache_dir, stream=True)
+    assert frl.is_modified()
+    assert list(frl.iter_funders()) == expected
+    frl.mark_loaded()
+    assert not frl.is_modified()
+    # The cache is written through unique temporary files
+    assert sorted(os.listdir(cache_dir)) == \
+        ['fundref_registry.rdf', 'fundref_registry.rdf.json']
+
+    # Unchanged registries are not downloaded again
+    with patch.object(mock_requests, 'get', wraps=mock_requests.get) as get:
+        frl = RemoteFundRefLoader(cache_dir=cache_dir, stream=True)
+        assert not frl.is_modified()
+        assert list(frl.iter_funders()) == expected
+        assert get.call_count == 1
+        assert get.call_args[1]['headers']['If-None-Match'] == '"1"'
+
+    # Changed registries are downloaded, but loaded only if the content has
+    # changed
+    with patch.object(mock_requests, 'etag', '"2"'):
+        frl = RemoteFundRefLoader(cache_dir=cache_dir, stream=True)
+        assert not frl.is_modified()
+        assert frl.read_cache_info()['etag'] == '"2"'
+
+    os.remove(os.path.join(cache_dir, 'fundref_registry.rdf'))
+    frl = RemoteFundRefLoader(cache_dir=cache_dir)
+    assert not frl.is_modified()
+    assert len(list(frl.iter_funders())) == 5
+
+
+def test_fundref_loader_stream(app):
+    """Test the streaming mode of the FundRef loaders."""
+    source = os.path.join(os.path.dirname(__file__),
+                          'testdata/fundref_test.rdf')
+    expected = list(LocalFundRefLoader(source=source).iter_funders())
+    frl = LocalFundRefLoader(source=source, stream=True)
+    assert not hasattr(frl, 'doc_root')
+    assert list(frl.iter_funders()) == expected
+
+    with patch('invenio_openaire.loaders.requests', mock_requests):
+        frl = RemoteFundRefLoader(stream=True)
+        assert list(frl.iter_funders()) == expected
+
+    frl = LocalFundRefLoader(stream=True)
+    funders = frl.iter_funders()
+    next(funders)
+    funders.close()
+    # The gzipped registry is opened anew on every iteration
+    assert sum(1 for _ in frl.iter_funders()) == 18067
+
+
 def test_local_openaire_loader(app):
     """Test the SQLite local loader."""
     loader = LocalOAIRELoader(source='tests/testdata/openaire_test.sqlite')
@@ -128,6 +191,49 @@ def test_local_openaire_loader(app):
     assert len(records) == 10
 
 
+def test_local_openaire_loader_parallel(app, db):
+    """Test the conversion of the local grants in worker processes."""
+    loader = LocalOAIRELoader(source='tests/testdata/openaire_test.sqlite')
+    records = list(loader.iter_grants())
+    assert list(loader.iter_grants(processes=2, batch_size=3)) == records
+    unordered = list(loader.iter_grants(processes=2, batch_size=3,
+                                        ordered=False))
+    assert sorted(r['internal_id'] for r in unordered) == \
+        sorted(r['internal_id'] for r in records)
+    assert list(loader.iter_grants(as_json=False, processes=2)) == \
+        list(loader.iter_grants(as_json=False))
+
+
+def test_openaire_loader_xpath_cache(app):
+    """Test the cache of compiled XPath expressions."""
+    loader = LocalOAIRELoader(source='tests/testdata/openaire_test.sqlite')
+    records = list(loader.iter_grants())
+    xpath = loader.compile_xpath('websiteurl')
+    assert loader.compile_xpath('websiteurl') is xpath
+    assert 'oai:identifier' in loader._xpaths
+
+    # Replacing the namespaces invalidates the compiled expressions
+    loader.namespaces = dict(loader.namespaces)
+    assert loader._xpaths == {}
+    assert list(loader.iter_grants()) == records
+
+
+def test_content_hash(app):
+    """Test the content hash of the converted funders and grants."""
+    loader = LocalOAIRELoader(source='tests/testdata/openaire_test.sqlite')
+    grant = next(loader.iter_grants())
+    assert 'content_hash' not in grant
+    assert content_hash(grant).startswith('md5:')
+    assert content_hash(dict(grant, remote_modified='2020-01-01')) == \
+        content_hash(grant)
+    assert content_hash(dict(grant, title='Foobar')) != content_hash(grant)
+
+    frl = LocalFundRefLoader(source=os.path.join(
+        os.path.dirname(__file__), 'testdata/fundref_test.rdf'))
+    for funder in frl.iter_funders():
+        assert 'content_hash' not in funder
+
+
 def test_local_openaire_loader_db_connection(app):
     """Test the SQLite local loader."""
     loader = LocalOAIRELoader(source='tests/testdata/openaire_test.sqlite')
@@ -160,16 +266,197 @@ def test_remote_openaire_loader(app, db):
     assert len(records) == 5
 
 
+@patch('invenio_openaire.loaders.Sickle', MockSickle)
+def test_openaire_loader_funder_names(app, db):
+    """Test the cache of the funder names."""
+    recuuid = uuid.uuid4()
+    PersistentIdentifier.create(
+        'frdoi', '10.13039/501100000925',
+        object_type='rec', object_uuid=recuuid, status='R')
+    record = Record.create({'acronyms': ['EC']}, id_=recuuid)
+    assert load_funder_names() == {'10.13039/501100000925': 'EC'}
+    assert list(iter_funder_records()) == [('10.13039/501100000925', dict(
+        acronyms=['EC'], name=None, identifiers=None))]
+
+    loader = RemoteOAIRELoader()
+    with patch('invenio_openaire.loaders.load_funder_names',
+               wraps=load_funder_names) as load:
+        records = list(loader.iter_grants())
+        assert len(records) == 5
+        assert load.call_count == 1
+
+        record['acronyms'] = ['NHMRC']
+        record.commit()
+        list(loader.iter_grants())
+        assert load.call_count == 1
+        loader.refresh_funder_names()
+        assert loader.funder_names == {'10.13039/501100000925': 'NHMRC'}
+        assert load.call_count == 2
+
+    # Given names are not reloaded
+    loader = RemoteOAIRELoader(funder_names={})
+    pytest.raises(OAIRELoadingError, list, loader.iter_grants())
+
+
+@patch('invenio_openaire.loaders.Sickle', MockSickle)
+def test_remote_openaire_loader_from_date(app):
+    """Test the incremental harvesting with the remote loader."""
+    loader = RemoteOAIRELoader(setspec='ECProjects')
+    assert loader.list_records_params() == dict(
+        metadataPrefix='oaf', set='ECProjects')
+    assert len(list(loader.iter_grants(as_json=False))) == 5
+
+    loader = RemoteOAIRELoader(from_date=datetime(2015, 11, 14, 12, 30))
+    assert loader.list_records_params()['from'] == '2015-11-14'
+    assert len(list(loader.iter_grants(as_json=False))) == 5
+
+    loader = RemoteOAIRELoader(from_date=date(2015, 11, 15))
+    assert list(loader.iter_grants(as_json=False)) == []
+
+
+@patch('invenio_openaire.loaders.Sickle', MockSickle)
+@patch.object(MockSickle, 'page_size', 2)
+def test_remote_openaire_loader_resume(app):
+    """Test the resumption of remote harvests."""
+    loader = RemoteOAIRELoader()
+    progress = [(loader.resumption_token, loader.harvested)
+                for _ in loader.iter_grants(as_json=False)]
+    assert progress == [(None, 0), (None, 0), ('2', 2), ('2', 2), ('4', 4)]
+
+    loader = RemoteOAIRELoader(resumption_token='2', harvested=2)
+    assert len(list(loader.iter_grants(as_json=False))) == 3
+    assert (loader.resumption_token, loader.harvested) == ('4', 4)
+
+    # Expired tokens restart the harvest
+    loader = RemoteOAIRELoader(resumption_token='expired', harvested=2)
+    assert len(list(loader.iter_grants(as_json=False))) == 5
+
+
+@patch('invenio_openaire.loaders.Sickle', MockSickle)
+@patch.object(MockSickle, 'page_size', 2)
+def test_remote_openaire_loader_throttle(app):
+    """Test the throttling of the OAI-PMH requests."""
+    calls = []
+    loader = RemoteOAIRELoader(throttle=lambda: calls.append(1))
+    assert len(list(loader.iter_grants(as_json=False))) == 5
+    assert len(calls) == 3
+
+
+@patch('invenio_openaire.loaders.Sickle', MockSickle)
+@patch.object(MockSickle, 'page_size', 2)
+def test_remote_openaire_loader_prefetch(app):
+    """Test the prefetching of the OAI-PMH pages."""
+    def progress(loader):
+        return [(loader.resumption_token, loader.harvested)
+                for _ in loader.iter_grants(as_json=False)]
+    loader = RemoteOAIRELoader(prefetch=0)
+    assert loader.prefetch == 0
+    expected = progress(loader)
+    assert RemoteOAIRELoader().prefetch == 2
+    assert progress(RemoteOAIRELoader(prefetch=1)) == expected
+
+    # Pages are fetched ahead of the consumer
+    requests = []
+    with patch.object(MockSickle, 'harvest',
+                      lambda self, **kwargs: requests.append(kwargs)):
+        grants = RemoteOAIRELoader(prefetch=2).iter_grants(as_json=False)
+        next(grants)
+        for _ in range(50):
+            if len(requests) == 3:
+                break
+            time.sleep(0.01)
+        assert len(requests) == 3
+        grants.close()
+
+    # No more pages are requested once the consumer stops
+    requests = []
+    with patch.object(MockSickle, 'page_size', 1), \
+            patch.object(MockSickle, 'harvest',
+                         lambda self, **kwargs: requests.append(kwargs)):
+        threads = set(threading.enumerate())
+        grants = RemoteOAIRELoader(prefetch=1).iter_grants(as_json=False)
+        next(grants)
+        fetcher, = set(threading.enumerate()) - threads
+        # The fetcher waits for the consumer with the first page consumed,
+        # the second one queued and the third one fetched, whose end is
+        # found with the request of the fourth page.
+        for _ in range(100):
+            if len(requests) == 4:
+                break
+            time.sleep(0.01)
+        grants.close()
+        fetcher.join(1)
+        assert not fetcher.is_alive()
+        assert len(requests) == 4
+
+    # Records fetched before an error are returned first
+    with patch.object(MockSickle, 'fail_after', 3):
+        loader = RemoteOAIRELoader(prefetch=2)
+        grants = loader.iter_grants(as_json=False)
+        assert len([next(grants) for _ in range(3)]) == 3
+        pytest.raises(IOError, next, grants)
+        assert (loader.resumption_token, loader.harvested) == ('2', 2)
+
+
 @patch('invenio_openaire.loaders.Sickle', MockSickle)
 def test_remote_openaire_loader_error(app):
     """Test the remote OAI-PMH OpenAIRE loader."""
     loader = RemoteOAIRELoader()
-    with patch('invenio_openaire.loaders.etree.fromstring') as fs:
+    with patch.object(loader, 'resolve_funder') as fs:
         fs.side_effect = FunderNotFoundError(1, 2, 3)
         records = list(loader.iter_grants())
         assert len(records) == 0
 
 
+@patch('invenio_openaire.loaders.Sickle', MockSickle)
+def test_grantxml2json_element(app, funder_record):
+    """Test the conversion of grants parsed as part of an OAI-PMH page."""
+    loader = RemoteOAIRELoader()
+    records = list(MockSickle(None).ListRecords())
+    assert len(set(rec.xml.getroottree().getroot() for rec in records)) == 1
+    assert [loader.grantxml2json(rec.xml) for rec in records] == \
+        [loader.grantxml2json(rec.raw) for rec in records]
+    assert list(loader.iter_grants(as_json=False)) == \
+        [rec.raw for rec in records]
+
+
+@patch('invenio_openaire.loaders.Sickle', MockSickle)
+def test_grant_extractors(app, funder_record):
+    """Test that the grant extractors convert the grants identically."""
+    connection = sqlite3.connect('tests/testdata/openaire_test.sqlite')
+    records = [data for data, in connection.execute('SELECT data FROM grants')]
+    connection.close()
+    records.extend(rec.xml for rec in MockSickle(None).ListRecords())
+    # Grant in the format of the OpenAIRE dumps
+    entity = etree.tounicode(etree.fromstring(records[0]).find(
+        './/{http://namespace.openaire.eu/oaf}entity'))
+    records.append(
+        '<record><result xmlns:dri="{0}"><header>'
+        '<dri:objIdentifier>oai:dnet:1</dri:objIdentifier>'
+        '<dri:dateOfTransformation>2016-01-01</dri:dateOfTransformation>'
+        '</header><metadata>{1}</metadata></result></record>'.format(
+            'http://www.driver-repository.eu/namespace/dri', entity))
+
+    def convert(loader, record):
+        try:
+            return json.dumps(loader.grantxml2json(record), sort_keys=True)
+        except FunderNotFoundError as e:
+            return e.args
+
+    xpath = LocalOAIRELoader(source='', extractor='xpath')
+    single_pass = LocalOAIRELoader(source='', extractor='single-pass')
+    expected = [convert(xpath, record) for record in records]
+    assert len(expected) == 16
+    # Same conversion with the tuned parser of the loaders
+    assert [convert(xpath, etree.fromstring(r)) for r in records[:10]] == \
+        expected[:10]
+    assert [convert(single_pass, record) for record in records] == expected
+    assert json.loads(expected[-1])['identifiers']['oaf'] == 'oai:dnet:1'
+
+    with pytest.raises(ValueError):
+        LocalOAIRELoader(source='', extractor='sax')
+
+
 def test_grant_funder_not_found(app):
     """Test the grant loading with non-existent funder."""
     loader = LocalOAIRELoader(
@@ -179,6 +466,37 @@ def test_grant_funder_not_found(app):
         list(loader.iter_grants())
 
 
+def test_funder_identifier_index(app, db):
+    """Test the index of the funder identifiers."""
+    resolver = FundRefDOIResolver()
+    assert resolver.index is FundRefDOIResolver().index
+    assert resolver.resolve_by_id('ec__________::EC') == \
+        'http://dx.doi.org/10.13039/501100000780'
+    assert resolver.resolve_by_doi(
+        'http://dx.doi.org/10.13039/501100000780') == 'ec__________::EC'
+    assert resolver.resolve_by_doi('10.13039/501100000780') == \
+        'ec__________::EC'
+    assert resolver.index.get_doi('ec__________::EC') == \
+        '10.13039/501100000780'
+    assert resolver.index.get_doi('foo') is None
+    assert resolver.resolve_by_id('foo') is None
+
+    # Stored funders are added to the index
+    recuuid = uuid.uuid4()
+    PersistentIdentifier.create(
+        'frdoi', '10.13039/501100000001',
+        object_type='rec', object_uuid=recuuid, status='R')
+    Record.create({'doi': '10.13039/501100000001',
+                   'identifiers': {'oaf': 'foo_________::FOO'}}, id_=recuuid)
+    assert FundRefDOIResolver().resolve_by_id('foo_________::FOO') is None
+    index = current_openaire.load_funder_index()
+    assert FundRefDOIResolver().index is index
+    assert FundRefDOIResolver().resolve_by_id('foo_________::FOO') == \
+        'http://dx.doi.org/10.13039/501100000001'
+    assert index.get_id('10.13039/501100000001') == 'foo_________::FOO'
+    assert index.get_id('10.13039/501100000780') == 'ec__________::EC'
+
+
 @patch('invenio_openaire.loaders.Sickle', MockSickle)
 def test_oaire_dumper(db, sqlite_tmpdb):
     """Test the grants dumper to local destination."""
@@ -195,3 +513,186 @@ def test_oaire_dumper(db, sqlite_tmpdb):
     loader = LocalOAIRELoader(source=sqlite_tmpdb)
     records = list(loader.iter_grants())
     assert len(records) == 5
+
+
+@patch('invenio_openaire.loaders.Sickle', MockSickle)
+@patch.object(MockSickle, 'page_size', 2)
+def test_oaire_dumper_resume(funder_record, sqlite_tmpdb):
+    """Test resuming an interrupted dump."""
+    dumper = OAIREDumper(destination=sqlite_tmpdb)
+    with patch.object(MockSickle, 'fail_after', 3):
+        pytest.raises(IOError, dumper.dump, as_json=False,
+                      commit_batch_size=1)
+    loader = LocalOAIRELoader(source=sqlite_tmpdb)
+    assert len(list(loader.iter_grants(as_json=False))) == 3
+
+    dumper = OAIREDumper(destination=sqlite_tmpdb)
+    dumper.dump(as_json=False, commit_batch_size=1)
+    loader = LocalOAIRELoader(source=sqlite_tmpdb)
+    records = list(loader.iter_grants(as_json=False))
+    assert len(records) == 5
+    assert len(set(records)) == 5
+    assert dumper.loader.harvested == 4
+
+
+@patch('invenio_openaire.loaders.Sickle', MockSickle)
+@patch.object(MockSickle, 'page_size', 2)
+def test_oaire_dumper_fast(funder_record, sqlite_tmpdb):
+    """Test the fast dump mode."""
+    dumper = OAIREDumper(destination=sqlite_tmpdb)
+    with patch.object(MockSickle, 'fail_after', 3):
+        pytest.raises(IOError, dumper.dump, as_json=False,
+                      commit_batch_size=1, fast=True)
+    loader = LocalOAIRELoader(source=sqlite_tmpdb)
+    assert len(list(loader.iter_grants(as_json=False))) == 3
+
+    dumper = OAIREDumper(destination=sqlite_tmpdb)
+    assert dumper.dump(as_json=False, commit_batch_size=2, fast=True) == 3
+    records = list(loader.iter_grants(as_json=False))
+    assert len(records) == 5
+    assert len(set(records)) == 5
+
+    connection = sqlite3.connect(sqlite_tmpdb)
+    assert connection.execute("PRAGMA journal_mode").fetchone() == \
+        ('delete', )
+    connection.close()
+    assert not os.path.exists(sqlite_tmpdb + '-wal')
+
+
+@patch('invenio_openaire.loaders.Sickle', MockSickle)
+def test_oaire_dumper_compress(funder_record, sqlite_tmpdb):
+    """Test the compressed records of the dump."""
+    def formats_and_size():
+        connection = sqlite3.connect(sqlite_tmpdb)
+        formats = [f for f, in connection.execute(
+            "SELECT format FROM grants")]
+        size, = connection.execute(
+            "SELECT SUM(LENGTH(data)) FROM grants").fetchone()
+        connection.close()
+        return formats, size
+
+    dumper = OAIREDumper(destination=sqlite_tmpdb)
+    dumper.dump(as_json=False)
+    loader = LocalOAIRELoader(source=sqlite_tmpdb)
+    xml_records = list(loader.iter_grants(as_json=False))
+    json_records = list(loader.iter_grants())
+    formats, plain_size = formats_and_size()
+    assert formats == ['xml'] * 5
+
+    dumper.dump(as_json=False, compress=True)
+    formats, compressed_size = formats_and_size()
+    assert formats == ['xml+zlib'] * 5
+    assert compressed_size < plain_size
+    assert list(loader.iter_grants(as_json=False)) == xml_records
+    assert list(loader.iter_grants()) == json_records
+
+    dumper.dump(compress=True, fast=True)
+    assert formats_and_size()[0] == ['json+zlib'] * 5
+    assert list(loader.iter_grants()) == json_records
+
+
+@patch('invenio_openaire.loaders.Sickle', MockSickle)
+def test_oaire_dumper_xml(app, sqlite_tmpdb):
+    """Test the XML dump without any funder records."""
+    dumper = OAIREDumper(destination=sqlite_tmpdb)
+    assert dumper.dump(as_json=False) == 5
+    connection = sqlite3.connect(sqlite_tmpdb)
+    rows = connection.execute(
+        "SELECT internal_id, oai_id, funder_doi, program, setspec, "
+        "remote_modified FROM grants ORDER BY rowid").fetchall()
+    connection.close()
+    assert len(rows) == 5
+    assert all(row[1].startswith('oai:dnet:') for row in rows)
+    assert all(row[4] == 'projects' for row in rows)
+    assert all(row[5].startswith('2015-11-14') for row in rows)
+    assert [row[2:4] for row in rows] == [
+        ('10.13039/501100000923', 'Future Fellowships'),
+        ('10.13039/501100000780', 'FP7'),
+        ('10.13039/100004440', 'Physiological Sciences'),
+        ('10.13039/501100001871', 'POCI'),
+        ('10.13039/501100000925', ''),
+    ]
+    assert rows[0][0] == '10.13039/501100000923::FT120100464'
+
+
+@patch('invenio_openaire.loaders.Sickle', MockSickle)
+def test_oaire_dumper_xml_unresolved(app, sqlite_tmpdb):
+    """Test the XML dump of the grants of unresolved funders."""
+    app.config['OPENAIRE_FIXED_FUNDERS'] = {
+        k: v for k, v in app.config['OPENAIRE_FIXED_FUNDERS'].items()
+        if k != 'arc_________::ARC'}
+    current_openaire._funder_index = None
+    for _ in range(2):
+        # Dumping again replaces the grants
+        assert OAIREDumper(destination=sqlite_tmpdb).dump(as_json=False) == 5
+        connection = sqlite3.connect(sqlite_tmpdb)
+        rows = connection.execute(
+            "SELECT internal_id, oai_id, funder_doi FROM grants "
+            "WHERE internal_id = oai_id").fetchall()
+        count, = connection.execute("SELECT COUNT(1) FROM grants").fetchone()
+        connection.close()
+        assert count == 5
+        assert len(rows) == 1
+        assert rows[0][2] is None
+
+
+@patch('invenio_openaire.loaders.Sickle', MockSickle)
+def test_oaire_dumper_schema(funder_record, sqlite_tmpdb):
+    """Test the indexed schema of the dump."""
+    dumper = OAIREDumper(destination=sqlite_tmpdb)
+    dumper.dump()
+    loader = LocalOAIRELoader(source=sqlite_tmpdb)
+    loader._connect()
+    assert dump_schema_version(loader.db_connection) == 2
+    assert loader._count() == 5
+    columns = "SELECT internal_id, oai_id, funder_doi, program, setspec, " \
+        "remote_modified FROM grants ORDER BY internal_id"
+    json_columns = loader.db_connection.execute(columns).fetchall()
+    loader._disconnect()
+    records = list(loader.iter_grants())
+
+    # Dumping again replaces the grants
+    OAIREDumper(destination=sqlite_tmpdb).dump(as_json=False)
+    loader._connect()
+    assert loader._count() == 5
+    # The columns of the XML grants are the same as of the JSON grants
+    assert loader.db_connection.execute(columns).fetchall() == json_columns
+    # The records are stored as UTF-8 bytes
+    assert loader.db_connection.execute(
+        "SELECT DISTINCT typeof(data) FROM grants").fetchall() == [('blob', )]
+    loader._disconnect()
+    assert list(loader.iter_grants()) == records
+    xml_records = list(loader.iter_grants(as_json=False))
+    assert all(r.startswith('<oai:record') for r in xml_records)
+
+    doi = '10.13039/501100000780'
+    ec_records = [r for r in records if r['internal_id'].startswith(doi)]
+    assert len(ec_records) == 1
+    assert list(loader.iter_grants(funder_doi=doi)) == ec_records
+    assert list(loader.iter_grants(funder_doi=doi, program='FP7')) == \
+        ec_records
+    assert list(loader.iter_grants(funder_doi=doi, program='H2020')) == []
+    assert list(loader.iter_grants(funder_doi='10.13039/foo')) == []
+    assert list(loader.iter_grants(setspec='projects')) == records
+    assert list(loader.iter_grants(funder_doi=doi, processes=2,
+                                   batch_size=2)) == ec_records
+    assert {r['remote_modified'][:10] for r in records} == {'2015-11-14'}
+    assert len(list(loader.iter_grants(from_date='2015-11-14'))) == 5
+    assert len(list(loader.iter_grants(from_date=date(2015, 11, 15)))) == 0
+    assert len(list(loader.iter_grants(until_date='2015-11-15'))) == 5
+    assert len(list(loader.iter_grants(until_date=date(2015, 11, 14)))) == 0
+    # Datetimes are compared with the full datestamps
+    assert len(list(loader.iter_grants(
+        from_date=datetime(2015, 11, 14, 12)))) == 0
+    assert len(list(loader.iter_grants(
+        until_date=datetime(2015, 11, 14, 12)))) == 5
+    loader._connect()
+    assert loader._count(funder_doi=doi) == 1
+    loader._disconnect()
+    pytest.raises(TypeError, list, loader.iter_grants(funder='EC'))
+
+    # Dumps of the first version cannot be filtered
+    loader = LocalOAIRELoader(source='tests/testdata/openaire_test.sqlite')
+    assert len(list(loader.iter_grants(funder_doi=None))) == 10
+    pytest.raises(OAIRELoadingError, list,
+                  loader.iter_grants(funder_doi=doi))
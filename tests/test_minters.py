@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016-2019 CERN.
+#
+# Invenio is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""PID Minters tests."""
+
+from __future__ import absolute_import, print_function
+
+import uuid
+
+import pytest
+from invenio_pidstore.errors import PIDAlreadyExists
+from invenio_pidstore.models import PersistentIdentifier, PIDStatus
+from mock import patch
+
+from invenio_openaire.minters import find_existing_pid, funder_bulk_minter, \
+    grant_bulk_minter, grant_minter
+
+
+def grant(code, purl=None):
+    """Grant data with its identifiers."""
+    return dict(
+        internal_id='10.13039/001::{0}'.format(code),
+        identifiers=dict(
+            oaf='oai:dnet:{0}'.format(code),
+            eurepo='info:eu-repo/grantAgreement/EC/FP7/{0}/'.format(code),
+            purl=purl,
+        ),
+    )
+
+
+def test_bulk_minter(app, db):
+    """Test the bulk minting of PIDs."""
+    records = [(uuid.uuid4(), grant(code)) for code in range(150)]
+    records.append((uuid.uuid4(), grant(150, purl='http://purl.org/150')))
+    assert grant_bulk_minter(records) == 151 * 3 + 1
+
+    # Same PIDs as minted one record at a time
+    grant_minter(uuid.uuid4(), grant(151, purl='http://purl.org/151'))
+    pids = PersistentIdentifier.query.all()
+    assert len(pids) == 152 * 3 + 2
+    assert all(p.status == PIDStatus.REGISTERED for p in pids)
+    assert set(p.object_type for p in pids) == set(['rec'])
+    for record_uuid, data in records:
+        pid = PersistentIdentifier.get('grant', data['internal_id'])
+        assert pid.object_uuid == record_uuid
+        for scheme, identifier in data['identifiers'].items():
+            if identifier:
+                assert PersistentIdentifier.get(
+                    scheme, identifier).object_uuid == record_uuid
+
+    funder_uuid = uuid.uuid4()
+    funder_bulk_minter([(funder_uuid, dict(
+        doi='10.13039/001', identifiers=dict(oaf='foo_________::FOO')))])
+    pid = PersistentIdentifier.get('frdoi', '10.13039/001')
+    assert pid.object_uuid == funder_uuid
+    assert PersistentIdentifier.get('oaf', 'foo_________::FOO').object_uuid \
+        == funder_uuid
+
+
+def test_bulk_minter_conflicts(app, db):
+    """Test that the PIDs of a batch are minted all or nothing."""
+    grant_minter(uuid.uuid4(), grant(1))
+    count = PersistentIdentifier.query.count()
+
+    with pytest.raises(PIDAlreadyExists):
+        grant_bulk_minter([(uuid.uuid4(), grant(0)),
+                           (uuid.uuid4(), grant(1))])
+    assert PersistentIdentifier.query.count() == count
+
+    # Conflicts within the batch
+    with pytest.raises(PIDAlreadyExists):
+        grant_bulk_minter([(uuid.uuid4(), grant(2)),
+                           (uuid.uuid4(), grant(2))])
+    assert PersistentIdentifier.query.count() == count
+    assert grant_bulk_minter([]) == 0
+
+
+def test_bulk_minter_concurrent_conflict(app, db):
+    """Test the PID reported on a conflict with a concurrent minting."""
+    grant_minter(uuid.uuid4(), grant(1))
+    checks = []
+
+    def check(values_by_type):
+        # PIDs minted concurrently after the first check
+        checks.append(values_by_type)
+        return find_existing_pid(values_by_type) if len(checks) > 1 else None
+
+    with patch('invenio_openaire.minters.find_existing_pid', check):
+        with pytest.raises(PIDAlreadyExists) as excinfo:
+            grant_bulk_minter([(uuid.uuid4(), grant(1))])
+    assert (excinfo.value.pid_type, excinfo.value.pid_value) in [
+        ('grant', '10.13039/001::1'), ('oaf', 'oai:dnet:1'),
+        ('eurepo', 'info:eu-repo/grantAgreement/EC/FP7/1/'),
+    ]
+    assert len(checks) == 2
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015-2019 CERN.
+#
+# Invenio is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+
+"""Tests for the asyncio OAI-PMH client."""
+
+from __future__ import absolute_import, print_function
+
+import threading
+from datetime import datetime
+from os.path import dirname, join
+
+import pytest
+from conftest import MockSickle
+from mock import patch
+from sickle.oaiexceptions import BadResumptionToken, NoRecordsMatch, OAIError
+
+from invenio_openaire.loaders import RemoteOAIRELoader
+from invenio_openaire.models import HarvestState
+from invenio_openaire.tasks import harvest_openaire_sets
+
+aiohttp = pytest.importorskip('aiohttp')
+asyncio = pytest.importorskip('asyncio')
+web = pytest.importorskip('aiohttp.web')
+oaipmh = pytest.importorskip('invenio_openaire.oaipmh')
+
+RESPONSE = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<oai:OAI-PMH xmlns:oai="http://www.openarchives.org/OAI/2.0/">'
+    '<oai:responseDate>2015-11-14T12:00:00Z</oai:responseDate>'
+    '<oai:request>http://localhost/oai_pmh</oai:request>{0}</oai:OAI-PMH>'
+)
+
+
+class StubOAIPMHServer(object):
+    """Local OAI-PMH endpoint serving the records of the mock harvester.
+
+    Records are split into pages of ``page_size`` records, linked with
+    resumption tokens. The set ``empty`` has no records, and the responses
+    of the set ``broken`` have no element of the verb.
+    """
+
+    page_size = 2
+
+    def __init__(self):
+        """Load the records and init the log of the requests."""
+        fname = join(dirname(__file__), 'testdata/mock_oai_pmh.txt')
+        with open(fname, 'r') as f:
+            self.records = [line.strip() for line in f]
+        self.requests = []
+        self.peers = set()
+
+    def error(self, code):
+        """Render an OAI-PMH error."""
+        return RESPONSE.format('<oai:error code="{0}"/>'.format(code))
+
+    def page(self, verb, offset):
+        """Render a page of records."""
+        end = offset + self.page_size
+        records = self.records[offset:end]
+        if verb == 'ListIdentifiers':
+            records = [r[r.index('<oai:header>'):r.index('</oai:header>')] +
+                       '</oai:header>' for r in records]
+        token = '<oai:resumptionToken>{0}</oai:resumptionToken>'.format(
+            end) if end < len(self.records) else ''
+        return RESPONSE.format('<oai:{0}>{1}{2}</oai:{0}>'.format(
+            verb, ''.join(records), token))
+
+    async def handle(self, request):
+        """Handle an OAI-PMH request."""
+        params = dict(request.query)
+        self.requests.append(
+            (params, request.headers.get('Accept-Encoding')))
+        self.peers.add(request.transport.get_extra_info('peername'))
+        verb = params.get('verb')
+        token = params.get('resumptionToken')
+        if verb == 'GetRecord':
+            body = RESPONSE.format(
+                '<oai:GetRecord>{0}</oai:GetRecord>'.format(self.records[0]))
+        elif params.get('set') == 'empty':
+            body = self.error('noRecordsMatch')
+        elif params.get('set') == 'broken':
+            body = RESPONSE.format('')
+        elif token is not None and not token.isdigit():
+            body = self.error('badResumptionToken')
+        else:
+            body = self.page(verb, int(token or 0))
+        response = web.Response(text=body, content_type='text/xml')
+        response.enable_compression()
+        return response
+
+
+@pytest.yield_fixture()
+def oai_server():
+    """Run the stub OAI-PMH endpoint in a background thread."""
+    server = StubOAIPMHServer()
+    loop = asyncio.new_event_loop()
+    webapp = web.Application()
+    webapp.router.add_get('/oai_pmh', server.handle)
+    runner = web.AppRunner(webapp)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    server.url = 'http://127.0.0.1:{0}/oai_pmh'.format(port)
+    thread = threading.Thread(target=loop.run_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.run_until_complete(runner.cleanup())
+    loop.close()
+
+
+def run(coroutine):
+    """Run a coroutine in a new event loop."""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_async_client_list_records(oai_server):
+    """Test the paginated ListRecords requests."""
+    async def harvest():
+        async with oaipmh.AsyncOAIPMHClient(oai_server.url) as client:
+            return [item async for item in client.list_records(
+                metadataPrefix='oaf', set='projects')]
+
+    records = run(harvest())
+    assert [token for token, _ in records] == \
+        [None, None, '2', '2', '4']
+    assert all(r.startswith('<oai:record') for _, r in records)
+    assert '16334a30683a15c1f16c33c4a39d2142' in records[0][1]
+
+    # All the pages are requested with gzip through a single connection
+    assert [params for params, _ in oai_server.requests] == [
+        dict(verb='ListRecords', metadataPrefix='oaf', set='projects'),
+        dict(verb='ListRecords', resumptionToken='2'),
+        dict(verb='ListRecords', resumptionToken='4'),
+    ]
+    assert all(enc == 'gzip' for _, enc in oai_server.requests)
+    assert len(oai_server.peers) == 1
+
+
+def test_async_client_list_identifiers(oai_server):
+    """Test the ListIdentifiers and GetRecord requests."""
+    async def harvest():
+        async with oaipmh.AsyncOAIPMHClient(oai_server.url) as client:
+            headers = [item async for item in client.list_identifiers(
+                metadataPrefix='oaf')]
+            record = await client.get_record('oai:dnet:1')
+            return headers, record
+
+    headers, record = run(harvest())
+    assert len(headers) == 5
+    assert all(h.startswith('<oai:header') for _, h in headers)
+    assert record.startswith('<oai:record')
+
+
+def test_async_client_errors(oai_server):
+    """Test the OAI-PMH errors."""
+    async def harvest(**params):
+        async with oaipmh.AsyncOAIPMHClient(oai_server.url) as client:
+            return [item async for item in client.list_records(**params)]
+
+    with pytest.raises(NoRecordsMatch):
+        run(harvest(metadataPrefix='oaf', set='empty'))
+    with pytest.raises(BadResumptionToken):
+        run(harvest(resumptionToken='expired'))
+    with pytest.raises(OAIError):
+        run(harvest(metadataPrefix='oaf', set='broken'))
+
+
+def test_async_client_harvest_sets(oai_server):
+    """Test the concurrent harvest of independent sets."""
+    harvested = []
+
+    async def harvest():
+        async with oaipmh.AsyncOAIPMHClient(oai_server.url,
+                                            concurrency=2) as client:
+            return await oaipmh.harvest_sets(
+                client, ['ECProjects', 'NHMRCProjects', 'empty'],
+                lambda *args: harvested.append(args), metadataPrefix='oaf')
+
+    counts = run(harvest())
+    assert counts == dict(ECProjects=5, NHMRCProjects=5, empty=0)
+    assert len(harvested) == 10
+    assert len(oai_server.peers) <= 2
+
+
+def test_async_client_harvest_sets_params(oai_server):
+    """Test the arguments of the sets and the number of concurrent sets."""
+    harvested = []
+
+    async def harvest():
+        async with oaipmh.AsyncOAIPMHClient(oai_server.url) as client:
+            return await oaipmh.harvest_sets(
+                client, dict(
+                    ECProjects=dict(resumptionToken='2'),
+                    NHMRCProjects=dict(metadataPrefix='oaf',
+                                       set='NHMRCProjects'),
+                    expired=dict(resumptionToken='expired'),
+                ), lambda *args: harvested.append(args[:2]), concurrency=1)
+
+    counts = run(harvest())
+    assert isinstance(counts.pop('expired'), BadResumptionToken)
+    assert counts == dict(ECProjects=3, NHMRCProjects=5)
+    # The sets are harvested one after the other
+    assert harvested == [('ECProjects', '2'), ('ECProjects', '2'),
+                         ('ECProjects', '4'), ('NHMRCProjects', None),
+                         ('NHMRCProjects', None), ('NHMRCProjects', '2'),
+                         ('NHMRCProjects', '2'), ('NHMRCProjects', '4')]
+
+
+def test_async_client_throttle(oai_server):
+    """Test that the throttle waits without blocking the other sets."""
+    waits = [0.5]
+    harvested = []
+
+    def throttle():
+        # Only the first request of the first set waits
+        return waits.pop() if waits else None
+
+    async def harvest():
+        async with oaipmh.AsyncOAIPMHClient(oai_server.url, concurrency=2,
+                                            throttle=throttle) as client:
+            return await oaipmh.harvest_sets(
+                client, ['ECProjects', 'NHMRCProjects'],
+                lambda *args: harvested.append(args[0]),
+                metadataPrefix='oaf')
+
+    assert run(harvest()) == dict(ECProjects=5, NHMRCProjects=5)
+    assert harvested == ['NHMRCProjects'] * 5 + ['ECProjects'] * 5
+
+
+@patch('invenio_openaire.loaders.Sickle', MockSickle)
+@patch.object(MockSickle, 'page_size', 2)
+def test_remote_openaire_loader_asyncio(app, funder_record, oai_server):
+    """Test the asyncio backend of the remote loader."""
+    sickle_grants = list(
+        RemoteOAIRELoader(source=oai_server.url).iter_grants())
+    calls = []
+    loader = RemoteOAIRELoader(source=oai_server.url, backend='asyncio',
+                               throttle=lambda: calls.append(1))
+    progress = [(loader.resumption_token, loader.harvested, grant)
+                for grant in loader.iter_grants()]
+    assert [grant for _, _, grant in progress] == sickle_grants
+    assert [p[:2] for p in progress] == \
+        [(None, 0), (None, 0), ('2', 2), ('2', 2), ('4', 4)]
+    assert len(calls) == 3
+
+    # Expired tokens restart the harvest
+    loader = RemoteOAIRELoader(source=oai_server.url, backend='asyncio',
+                               resumption_token='expired', harvested=2)
+    assert len(list(loader.iter_grants(as_json=False))) == 5
+
+    loader = RemoteOAIRELoader(source=oai_server.url, backend='asyncio',
+                               setspec='empty', prefetch=0)
+    assert list(loader.iter_grants()) == []
+
+    with pytest.raises(ValueError):
+        RemoteOAIRELoader(backend='unknown')
+
+
+@patch('invenio_openaire.tasks.wait_for_registrations')
+@patch('invenio_openaire.tasks.register_grants_bulk')
+def test_harvest_openaire_sets(register, wait, app, db, es, funder_record,
+                               oai_server):
+    """Test the concurrent harvest of the sets by a single task."""
+    app.config.update(OPENAIRE_OAIPMH_ENDPOINT=oai_server.url,
+                      OPENAIRE_GRANTS_CHUNK_SIZE=2)
+    started = datetime(2019, 1, 1)
+    HarvestState.checkpoint('NHMRCProjects', 'expired', 2, started)
+    db.session.commit()
+
+    harvest_openaire_sets(['ECProjects', 'NHMRCProjects', 'empty'],
+                          defer_indexing=True, concurrency=2)
+    assert sorted(len(c[0][0][0]) for c in
+                  register.apply_async.call_args_list) == [1, 1, 2, 2, 2, 2]
+    assert wait.delay.call_count == 1
+    assert len(wait.delay.call_args[0][0]) == 6
+    for setspec in ('ECProjects', 'NHMRCProjects', 'empty'):
+        state = HarvestState.get(setspec)
+        assert state.resumption_token is None
+        assert state.lastrun is not None
+    # The expired harvest is restarted, since its start time
+    assert HarvestState.get('NHMRCProjects').lastrun == started
+
+    # The errors of a set do not stop the other sets
+    register.reset_mock()
+    pytest.raises(OAIError, harvest_openaire_sets,
+                  ['broken', 'NHMRCProjects'], defer_indexing=False)
+    assert register.apply_async.call_count == 3
+    assert HarvestState.get('NHMRCProjects').lastrun > started
+    assert HarvestState.get('broken') is None
@@ -10,11 +10,27 @@
 
 from __future__ import absolute_import, print_function
 
-from invenio_pidstore.models import PersistentIdentifier
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from celery.exceptions import Retry
+from conftest import MockSickle, mock_requests
+from invenio_indexer.tasks import process_bulk_queue
+from invenio_pidstore.models import PersistentIdentifier, PIDStatus
 from invenio_records.api import Record
 from invenio_records.models import RecordMetadata
+from mock import patch
 
-from invenio_openaire.tasks import harvest_fundref, harvest_openaire_projects
+from invenio_openaire.loaders import LocalOAIRELoader, RemoteFundRefLoader, \
+    content_hash
+from invenio_openaire.models import ContentHash, HarvestState, RequestBudget
+from invenio_openaire.proxies import current_openaire
+from invenio_openaire.tasks import chunked, harvest_all_openaire_projects, \
+    harvest_fundref, harvest_openaire_projects, load_grants_sharded, \
+    mark_fundref_loaded, register_funder, register_grants_bulk, \
+    register_grants_shard, resolve_records, unregistered_pids, \
+    wait_for_registrations
 
 
 def test_harvest_openaire_projects(app, db, es, funders):
@@ -53,6 +69,29 @@ def test_reharvest_fundref(app, db, es):
         assert record['remote_modified'] != 'Foobar'
 
 
+@patch('invenio_openaire.loaders.requests', mock_requests)
+def test_harvest_fundref_unchanged(app, db, es):
+    """Test the harvest of an unchanged remote FundRef registry."""
+    with patch('invenio_openaire.tasks.register_funder') as register:
+        register.apply_async.return_value.id = 'task-id'
+        # Marked as loaded only once the funders are registered
+        with patch('invenio_openaire.tasks.wait_for_registrations') as wait:
+            harvest_fundref()
+            harvest_fundref()
+        assert register.apply_async.call_count == 10
+        callback = wait.delay.call_args[1]['callback']
+        assert callback.task == mark_fundref_loaded.name
+        assert callback.args == (RemoteFundRefLoader().checksum, )
+
+        register.apply_async.reset_mock()
+        harvest_fundref()
+        assert register.apply_async.call_count == 5
+        harvest_fundref()
+        assert register.apply_async.call_count == 5
+        harvest_fundref(force=True)
+        assert register.apply_async.call_count == 10
+
+
 def test_harvest_all(app, db, es):
     """Test harvest_openaire_projects."""
     with app.app_context():
@@ -62,3 +101,372 @@ def test_harvest_all(app, db, es):
         harvest_openaire_projects(source='tests/testdata/openaire_test.sqlite')
         assert PersistentIdentifier.query.count() == 46
         assert RecordMetadata.query.count() == 15
+
+
+def test_chunked():
+    """Test splitting of iterators into chunks."""
+    assert list(chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(chunked([], 2)) == []
+
+
+def test_register_grants_bulk(app, db, es, funders):
+    """Test registering grants in bulk."""
+    loader = LocalOAIRELoader(source='tests/testdata/openaire_test.sqlite')
+    grants = list(loader.iter_grants())
+    with patch('invenio_openaire.tasks.RecordIndexer') as indexer, \
+            patch('invenio_openaire.tasks.resolve_records',
+                  wraps=resolve_records) as resolve:
+        register_grants_bulk(grants[:4] + grants[:6])
+        assert PersistentIdentifier.query.count() == 6 + 6 * 4
+        assert RecordMetadata.query.count() == 5 + 6
+        assert indexer.return_value.bulk_index.call_count == 1
+        assert len(indexer.return_value.bulk_index.call_args[0][0]) == 6
+
+        # Only new and modified grants are indexed.
+        indexer.reset_mock()
+        grants[0]['title'] = 'Foobar'
+        grants[1]['remote_modified'] = '2020-01-01T00:00:00Z'
+        register_grants_bulk(grants)
+        assert PersistentIdentifier.query.count() == 46
+        assert RecordMetadata.query.count() == 15
+        assert len(indexer.return_value.bulk_index.call_args[0][0]) == 5
+        # Only the records of the modified grants are fetched.
+        assert resolve.call_args[0][1] == [grants[0]['internal_id']]
+
+        indexer.reset_mock()
+        register_grants_bulk(grants)
+        assert not indexer.return_value.bulk_index.called
+        assert resolve.call_args[0][1] == []
+
+
+def test_harvest_defer_indexing(app, db, es):
+    """Test the deferred bulk indexing of harvested records."""
+    flushed = []
+
+    def flush(*args, **kwargs):
+        # Flushed once all the records are registered
+        flushed.append(RecordMetadata.query.count())
+    with patch('invenio_openaire.tasks.RecordIndexer') as indexer, \
+            patch.object(process_bulk_queue, 'run', side_effect=flush):
+        harvest_fundref(source='tests/testdata/fundref_test.rdf',
+                        defer_indexing=True)
+        assert RecordMetadata.query.count() == 5
+        assert not indexer.return_value.index_by_id.called
+        assert indexer.return_value.bulk_index.call_count == 5
+        assert flushed == [5]
+
+        indexer.reset_mock()
+        harvest_openaire_projects(
+            source='tests/testdata/openaire_test.sqlite', defer_indexing=True)
+        assert RecordMetadata.query.count() == 15
+        assert indexer.return_value.bulk_index.call_count == 1
+        assert not indexer.return_value.process_bulk_queue.called
+        assert flushed == [5, 15]
+
+    app.config['OPENAIRE_DEFER_INDEXING'] = True
+    with patch('invenio_openaire.tasks.wait_for_registrations') as wait, \
+            patch.object(register_funder, 'apply_async') as register:
+        harvest_fundref(source='tests/testdata/fundref_test.rdf',
+                        defer_indexing=False)
+        assert not wait.delay.called
+        assert all(c[1]['ignore_result'] for c in register.call_args_list)
+
+        register.reset_mock()
+        harvest_fundref(source='tests/testdata/fundref_test.rdf')
+        # Only the ids of the tasks are sent, not their data.
+        task_ids, = wait.delay.call_args[0]
+        assert task_ids == [register.return_value.id] * 5
+        assert wait.delay.call_args[1] == dict(flush_bulk_queue=True,
+                                               callback=None)
+        assert not any(c[1]['ignore_result']
+                       for c in register.call_args_list)
+
+
+def test_wait_for_registrations(app):
+    """Test waiting for the registration tasks before flushing the queue."""
+    with patch('invenio_openaire.tasks.ResultSet') as results, \
+            patch.object(process_bulk_queue, 'delay') as flush:
+        results.return_value.ready.return_value = False
+        pytest.raises(Retry, wait_for_registrations, ['a', 'b'],
+                      flush_bulk_queue=True)
+        assert [r.id for r in results.call_args[0][0]] == ['a', 'b']
+        assert not flush.called
+
+        results.return_value.ready.return_value = True
+        wait_for_registrations(['a', 'b'], flush_bulk_queue=True)
+        assert flush.called
+        assert results.return_value.forget.called
+
+    # The callback is only sent if all the tasks succeeded
+    with patch('invenio_openaire.tasks.ResultSet') as results, \
+            patch('invenio_openaire.tasks.signature') as signature:
+        results.return_value.successful.return_value = False
+        wait_for_registrations(['a'], callback='callback')
+        assert not signature.called
+
+        results.return_value.successful.return_value = True
+        wait_for_registrations(['a'], callback='callback')
+        signature.assert_called_once_with('callback')
+        assert signature.return_value.delay.called
+
+
+def test_resolve_records(app, db, es, funders):
+    """Test resolving many PIDs with a single query."""
+    resolved = resolve_records(
+        'frdoi', ['10.13039/001', '10.13039/002', '10.13039/999'])
+    assert sorted(resolved.keys()) == ['10.13039/001', '10.13039/002']
+    pid, record = resolved['10.13039/001']
+    assert pid.object_uuid == record.id
+    assert record['name'] == 'University of Foo'
+    assert resolve_records('frdoi', []) == {}
+    assert resolve_records('grant', ['10.13039/001']) == {}
+
+    # PIDs which are not registered are left out
+    PersistentIdentifier.get('frdoi', '10.13039/002').delete()
+    db.session.commit()
+    assert list(resolve_records('frdoi', ['10.13039/002'])) == []
+    assert unregistered_pids('frdoi', ['10.13039/001', '10.13039/002']) == \
+        {'10.13039/002': PIDStatus.DELETED}
+
+
+def test_register_grants_bulk_conflict(app, db, es, funders):
+    """Test that a PID conflict only skips the conflicting grants."""
+    loader = LocalOAIRELoader(source='tests/testdata/openaire_test.sqlite')
+    grants = list(loader.iter_grants())
+    PersistentIdentifier.create(
+        'eurepo', grants[2]['identifiers']['eurepo'],
+        object_type='rec', object_uuid=uuid.uuid4(), status='R')
+    db.session.commit()
+    # Conflicting PIDs within the chunk
+    grants[4]['identifiers']['purl'] = 'http://purl.org/foo'
+    grants[5]['identifiers']['purl'] = 'http://purl.org/foo'
+
+    with patch('invenio_openaire.tasks.RecordIndexer') as indexer:
+        register_grants_bulk(grants)
+    registered = [pid.pid_value for pid in PersistentIdentifier.query
+                  .filter_by(pid_type='grant')]
+    assert sorted(registered) == sorted(
+        g['internal_id'] for i, g in enumerate(grants) if i not in (2, 5))
+    assert RecordMetadata.query.count() == 5 + 8
+    assert len(indexer.return_value.bulk_index.call_args[0][0]) == 8
+
+
+def test_register_deleted_pid(app, db, es, funders):
+    """Test that grants with a deleted PID are not registered again."""
+    loader = LocalOAIRELoader(source='tests/testdata/openaire_test.sqlite')
+    grants = list(loader.iter_grants())
+    register_grants_bulk(grants[:2])
+    pid = PersistentIdentifier.get('grant', grants[0]['internal_id'])
+    record = Record.get_record(pid.object_uuid)
+    pid.delete()
+    db.session.commit()
+
+    grants[0]['title'] = 'Foobar'
+    register_grants_bulk(grants[:4])
+    assert Record.get_record(record.id)['title'] != 'Foobar'
+    assert PersistentIdentifier.get(
+        'grant', grants[0]['internal_id']).status == PIDStatus.DELETED
+    assert PersistentIdentifier.query.filter_by(
+        pid_type='grant', status=PIDStatus.REGISTERED).count() == 3
+
+
+def test_reharvest_content_hash(app, db, es):
+    """Test the change detection based on the content hash."""
+    harvest_fundref(source='tests/testdata/fundref_test.rdf')
+    recid = PersistentIdentifier.query.filter_by(
+        pid_type='frdoi', pid_value='10.13039/001').one().object_uuid
+    record = Record.get_record(recid)
+    # The hash is stored alongside the record, outside of its metadata.
+    assert 'content_hash' not in record
+    stored_hash = ContentHash.get_many([recid])[recid]
+    assert stored_hash == content_hash(record)
+
+    # Records are not touched when the content hash did not change.
+    record['name'] = 'Foobar'
+    record.commit()
+    db.session.commit()
+    harvest_fundref(source='tests/testdata/fundref_test.rdf')
+    assert Record.get_record(recid)['name'] == 'Foobar'
+
+    # Records stored without a content hash are compared as a whole.
+    ContentHash.query.delete()
+    db.session.commit()
+    harvest_fundref(source='tests/testdata/fundref_test.rdf')
+    assert Record.get_record(recid)['name'] == 'University of Foo'
+    assert ContentHash.get_many([recid]) == {recid: stored_hash}
+
+    # The hash is stored even if the record is unchanged.
+    grants = list(LocalOAIRELoader(
+        source='tests/testdata/openaire_test.sqlite').iter_grants())
+    register_grants_bulk(grants)
+    ContentHash.query.delete()
+    db.session.commit()
+    with patch('invenio_openaire.tasks.RecordIndexer') as indexer:
+        harvest_fundref(source='tests/testdata/fundref_test.rdf')
+        register_grants_bulk(grants)
+    assert not indexer.return_value.index_by_id.called
+    assert not indexer.return_value.bulk_index.called
+    assert ContentHash.query.count() == 15
+
+
+@patch('invenio_openaire.loaders.Sickle', MockSickle)
+def test_harvest_incremental(app, db, es, funder_record):
+    """Test the incremental harvesting of grants."""
+    with patch('invenio_openaire.tasks.register_grants_bulk') as register:
+        before = datetime.utcnow()
+        harvest_openaire_projects(setspec='ARCProjects', incremental=True)
+        assert register.apply_async.call_count == 1
+        lastrun = HarvestState.get_lastrun('ARCProjects')
+        assert lastrun >= before
+        assert HarvestState.get_lastrun('ECProjects') is None
+
+        # Nothing was modified since the last harvest
+        register.reset_mock()
+        harvest_openaire_projects(setspec='ARCProjects', incremental=True)
+        assert not register.apply_async.called
+        assert HarvestState.get_lastrun('ARCProjects') > lastrun
+
+        # Full harvest ignores the state of the set
+        HarvestState.update_lastrun('ARCProjects', datetime(2015, 11, 14))
+        harvest_openaire_projects(setspec='ARCProjects')
+        assert register.apply_async.call_count == 1
+
+
+@pytest.mark.parametrize('defer_indexing', [False, True])
+@patch('invenio_openaire.loaders.Sickle', MockSickle)
+@patch.object(MockSickle, 'page_size', 2)
+def test_harvest_resume(app, db, es, funder_record, defer_indexing):
+    """Test resuming an interrupted harvest of grants."""
+    app.config['OPENAIRE_GRANTS_CHUNK_SIZE'] = 2
+    with patch('invenio_openaire.tasks.register_grants_bulk') as register, \
+            patch('invenio_openaire.tasks.wait_for_registrations') as wait:
+        with patch.object(MockSickle, 'fail_after', 4):
+            pytest.raises(IOError, harvest_openaire_projects,
+                          setspec='ARCProjects',
+                          defer_indexing=defer_indexing)
+        assert register.apply_async.call_count == 2
+        assert not wait.delay.called
+        state = HarvestState.get('ARCProjects')
+        assert (state.resumption_token, state.harvested) == ('2', 2)
+        assert state.lastrun is None
+        started = state.started
+
+        register.reset_mock()
+        harvest_openaire_projects(setspec='ARCProjects',
+                                  defer_indexing=defer_indexing)
+        assert [len(c[0][0][0]) for c in
+                register.apply_async.call_args_list] == [2, 1]
+        assert wait.delay.called == defer_indexing
+        state = HarvestState.get('ARCProjects')
+        assert state.lastrun == started
+        assert state.resumption_token is None
+
+
+@patch('invenio_openaire.loaders.Sickle', MockSickle)
+@patch.object(MockSickle, 'page_size', 2)
+def test_harvest_resume_expired(app, db, es, funder_record):
+    """Test restarting an interrupted incremental harvest from its window."""
+    app.config['OPENAIRE_GRANTS_CHUNK_SIZE'] = 2
+    HarvestState.update_lastrun('ARCProjects', datetime(2015, 1, 1))
+    with patch('invenio_openaire.tasks.register_grants_bulk') as register:
+        with patch.object(MockSickle, 'fail_after', 4):
+            pytest.raises(IOError, harvest_openaire_projects,
+                          setspec='ARCProjects', incremental=True)
+        state = HarvestState.get('ARCProjects')
+        assert state.from_date == datetime(2015, 1, 1)
+
+        # No grants were modified since the start of the window.
+        state.from_date = datetime(2016, 1, 1)
+        state.resumption_token = 'expired'
+        db.session.commit()
+        register.reset_mock()
+        harvest_openaire_projects(setspec='ARCProjects')
+        assert not register.apply_async.called
+        state = HarvestState.get('ARCProjects')
+        assert state.resumption_token is None
+        assert state.from_date is None
+
+
+def test_request_budget(app, db):
+    """Test the shared request budget of an endpoint."""
+    now = datetime(2019, 1, 1)
+    assert RequestBudget.consume('oai', 2, burst=2, now=now) == 0
+    assert RequestBudget.consume('oai', 2, burst=2, now=now) == 0
+    assert RequestBudget.consume('oai', 2, burst=2, now=now) == 0.5
+    assert RequestBudget.consume('oai', 2, burst=2, now=now) == 1
+    # Reserved requests are refilled first
+    later = now + timedelta(seconds=1)
+    assert RequestBudget.consume('oai', 2, burst=2, now=later) == 0.5
+    # The bucket does not exceed the burst
+    later = now + timedelta(seconds=60)
+    assert RequestBudget.consume('oai', 2, burst=2, now=later) == 0
+    assert RequestBudget.consume('oai', 2, burst=2, now=later) == 0
+    assert RequestBudget.consume('oai', 2, burst=2, now=later) == 0.5
+    assert RequestBudget.consume('other', 2, burst=2, now=later) == 0
+
+
+@patch('invenio_openaire.loaders.Sickle', MockSickle)
+@patch.object(MockSickle, 'page_size', 2)
+def test_harvest_rate_limit(app, db, es, funder_record):
+    """Test the rate limit of the OAI-PMH requests."""
+    app.config['OPENAIRE_OAIPMH_RATE_LIMIT'] = 10
+    app.config['OPENAIRE_OAIPMH_PREFETCH'] = 0
+    with patch('invenio_openaire.tasks.register_grants_bulk'), \
+            patch('invenio_openaire.loaders.time.sleep') as sleep, \
+            patch('invenio_openaire.models.datetime') as clock:
+        clock.utcnow.return_value = datetime(2019, 1, 1)
+        harvest_openaire_projects(setspec='ARCProjects')
+    # The first request is sent right away, the next ones wait
+    assert [round(c[0][0], 6) for c in sleep.call_args_list] == [0.1, 0.2]
+
+
+def test_harvest_all_concurrency(app):
+    """Test the split of the sets in concurrent chains of harvests."""
+    setspecs = app.config['OPENAIRE_GRANTS_SPECS']
+    with patch('invenio_openaire.tasks.chain') as chain:
+        harvest_all_openaire_projects()
+        assert chain.call_count == 1
+        assert [s.kwargs['setspec'] for s in chain.call_args[0][0]] == \
+            setspecs
+
+        chain.reset_mock()
+        harvest_all_openaire_projects(concurrency=3)
+        chains = [[s.kwargs['setspec'] for s in c[0][0]]
+                  for c in chain.call_args_list]
+        assert len(chains) == 3
+        assert sorted(sum(chains, [])) == sorted(setspecs)
+        assert chains[0] == setspecs[0::3]
+        assert chain.return_value.apply_async.call_count == 3
+
+    # The asyncio client harvests all the sets in a single task
+    app.config['OPENAIRE_OAIPMH_BACKEND'] = 'asyncio'
+    with patch('invenio_openaire.tasks.chain') as chain, \
+            patch('invenio_openaire.tasks.harvest_openaire_sets') as harvest:
+        harvest_all_openaire_projects(concurrency=3)
+        harvest.delay.assert_called_once_with(
+            setspecs, defer_indexing=None, incremental=False, concurrency=3)
+        assert not chain.called
+
+
+def test_load_grants_sharded(app, db, es, funders):
+    """Test the sharded loading of a local OpenAIRE database."""
+    source = 'tests/testdata/openaire_test.sqlite'
+    with patch('invenio_openaire.tasks.grants_shards_loaded.run') as loaded:
+        load_grants_sharded(source, shard_size=3)
+    counts, = loaded.call_args[0][:1]
+    assert counts == [3, 3, 3, 1]
+    assert loaded.call_args[0][1] == source
+    assert PersistentIdentifier.query.filter_by(pid_type='grant').count() == 10
+
+    # Loading again does not create any record
+    load_grants_sharded(source, shard_size=4, defer_indexing=True)
+    assert RecordMetadata.query.count() == 15
+
+
+def test_register_grants_shard_funder_index(app, db, es, funders):
+    """Test resolving the funders known from the stored records only."""
+    app.config['OPENAIRE_FIXED_FUNDERS'] = {}
+    current_openaire._funder_index = None
+    source = 'tests/testdata/openaire_test.sqlite'
+    assert register_grants_shard(source, 1, 4) == 3
+    assert PersistentIdentifier.query.filter_by(pid_type='grant').count() == 3